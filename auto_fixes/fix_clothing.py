@@ -4,6 +4,8 @@ import math
 
 from utils.contants import *
 from utils.headers import *
+from utils.performance import timed_stage
+from auto_fixes.fix_products import has_strings, remove_bad_chars, unrounded_mask
 
 
 
@@ -14,16 +16,16 @@ def fix_description(df: pd.DataFrame):
     if desc_col is None or desc_col not in df.columns:
         return df, []
 
-    for i, desc in df[desc_col].items():
-        if isinstance(desc, str):
-            og_desc = desc
-            final = desc
+    if not has_strings(df[desc_col]):
+        return df, []
+
+    descs = df[desc_col]
+    long_mask = descs.str.len() > 50        # Non-string cells give NaN, so never count as long
+    shortened = descs[long_mask].str.slice(0, 50)
 
-            if len(desc) > 50:
-                final = desc[:50]
-                changes.append(f"Line {i+2} \u00A0\u00A0|\u00A0\u00A0 Long description: '{og_desc}' shortened to '{final}'")
-            if desc != final:
-                df.at[i, desc_col] = final
+    changes = [f"Line {i+2} \u00A0\u00A0|\u00A0\u00A0 Long description: '{og_desc}' shortened to '{final}'"
+               for i, og_desc, final in zip(shortened.index, descs[long_mask], shortened)]
+    df.loc[long_mask, desc_col] = shortened
     return df, changes
 
 
@@ -38,13 +40,17 @@ def fix_decimals(df: pd.DataFrame):
         if col_name is None or col_name not in df.columns:
             continue
 
-        for i, num in df[col_name].items():
+        # Any value with more than 2 decimal places changes when rounded. Only those go through Decimal
+        rounded = {}
+        for i, num in df.loc[unrounded_mask(df[col_name]), col_name].items():
             if isinstance(num, (int, float)) and not math.isnan(num):
                 decimal_val = Decimal(str(num))
                 if -decimal_val.as_tuple().exponent > 2:
                     new_num = round(num, 2)
-                    df.at[i, col_name] = new_num
+                    rounded[i] = new_num
                     changes.append(f"Line {i+2} \u00A0\u00A0|\u00A0\u00A0 {col_name} of {num} rounded to {new_num}")
+        if rounded:
+            df.loc[list(rounded), col_name] = list(rounded.values())
     return df, changes
 
 
@@ -52,12 +58,13 @@ def fix_decimals(df: pd.DataFrame):
 
 def fix_vat(df: pd.DataFrame):
     """Assign the correct VAT codes for given percentages"""
-    changes = []
-    for i, vat in df['vatrate'].items():
-        if vat in VAT_CODES:
-            new_vat = VAT_CODES[vat]
-            df.at[i, 'vatrate'] = new_vat
-            changes.append(f"Line {i+2} \u00A0\u00A0|\u00A0\u00A0 VAT Rate {vat} updated to code {new_vat}")
+    codes = df['vatrate'].map(VAT_CODES)
+    vat_mask = codes.notna()
+    new_codes = codes[vat_mask].astype(int)
+
+    changes = [f"Line {i+2} \u00A0\u00A0|\u00A0\u00A0 VAT Rate {vat} updated to code {new_vat}"
+               for i, vat, new_vat in zip(new_codes.index, df.loc[vat_mask, 'vatrate'], new_codes)]
+    df.loc[vat_mask, 'vatrate'] = new_codes
     return df, changes
 
 
@@ -70,19 +77,23 @@ def fix_color(df: pd.DataFrame):
     if "colour" not in df.columns:
         return df, []
 
-    for i, desc in df["colour"].items():
-        if isinstance(desc, str):
-            og_desc = desc
-            cleaned = ''.join(c for c in desc if c not in BAD_CHARS)
-            final = cleaned
-
-            if og_desc != cleaned:
-                changes.append(f"Line {i+2} \u00A0\u00A0|\u00A0\u00A0 Bad characters removed from color description: '{og_desc}', updated to '{cleaned}'")
-            if len(cleaned) > 10:
-                final = cleaned[:10]
-                changes.append(f"Line {i+2} \u00A0\u00A0|\u00A0\u00A0 Long color description: '{og_desc}' shortened to '{final}'")
-            if desc != final:
-                df.at[i, "colour"] = final
+    if not has_strings(df["colour"]):
+        return df, []
+
+    colours = df["colour"]
+    cleaned = colours.str.translate(BAD_CHAR_TABLE)      # Non-string cells come back as NaN
+    final = cleaned.str.slice(0, 10)
+    bad_mask = cleaned.notna() & (cleaned != colours)
+    long_mask = cleaned.str.len() > 10
+
+    for i in colours.index[bad_mask | long_mask]:
+        if bad_mask[i]:
+            changes.append(f"Line {i+2} \u00A0\u00A0|\u00A0\u00A0 Bad characters removed from color description: '{colours[i]}', updated to '{cleaned[i]}'")
+        if long_mask[i]:
+            changes.append(f"Line {i+2} \u00A0\u00A0|\u00A0\u00A0 Long color description: '{colours[i]}' shortened to '{final[i]}'")
+
+    changed = bad_mask | long_mask
+    df.loc[changed, "colour"] = final[changed]
     return df, changes
 
 
@@ -93,14 +104,13 @@ def fix_bad_char(df: pd.DataFrame) -> str:
     """
     changes = []
     for col in df.columns:
-        if df[col].dtype == object:
-            for i, val in df[col].items():
-                if isinstance(val, str):          # Avoid type error
-                    cleaned = ''.join(char for char in val if char not in BAD_CHARS)
+        if has_strings(df[col]):
+            changed, cleaned = remove_bad_chars(df[col])
 
-                    if val != cleaned:
-                        df.at[i, col] = cleaned
-                        changes.append(f"Line {i} \u00A0\u00A0|\u00A0\u00A0 Bad characters removed from column '{col}'")
+            if changed.any():
+                df.loc[changed, col] = cleaned
+                message = f" \u00A0\u00A0|\u00A0\u00A0 Bad characters removed from column '{col}'"
+                changes.extend([f"Line {i}{message}" for i in df.index[changed]])
 
     return df, changes
 
@@ -108,6 +118,7 @@ def fix_bad_char(df: pd.DataFrame) -> str:
 
 
 
+@timed_stage("auto-fix")
 def update_all_clothing(df: pd.DataFrame):
     df = df.copy()
     
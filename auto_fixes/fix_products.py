@@ -1,9 +1,11 @@
 import pandas as pd
+import numpy as np
 from decimal import Decimal
 import math
 
 from utils.contants import *
 from utils.headers import *
+from utils.performance import timed_stage
 
 
 def fix_description(df: pd.DataFrame):
@@ -13,16 +15,16 @@ def fix_description(df: pd.DataFrame):
     if desc_col is None or desc_col not in df.columns:
         return df, []
 
-    for i, desc in df[desc_col].items():
-        if isinstance(desc, str):
-            og_desc = desc
-            final = desc
+    if not has_strings(df[desc_col]):
+        return df, []
+
+    descs = df[desc_col]
+    long_mask = descs.str.len() > 50        # Non-string cells give NaN, so never count as long
+    shortened = descs[long_mask].str.slice(0, 50)
 
-            if len(desc) > 50:
-                final = desc[:50]
-                changes.append(f"Line {i+2} \u00A0\u00A0|\u00A0\u00A0 Long description: '{og_desc}' shortened to '{final}'")
-            if desc != final:
-                df.at[i, desc_col] = final
+    changes = [f"Line {i+2} \u00A0\u00A0|\u00A0\u00A0 Long description: '{og_desc}' shortened to '{final}'"
+               for i, og_desc, final in zip(shortened.index, descs[long_mask], shortened)]
+    df.loc[long_mask, desc_col] = shortened
     return df, changes
 
 
@@ -37,13 +39,17 @@ def fix_decimals(df: pd.DataFrame):
         if col_name is None or col_name not in df.columns:
             continue
 
-        for i, num in df[col_name].items():
+        # Any value with more than 2 decimal places changes when rounded. Only those go through Decimal
+        rounded = {}
+        for i, num in df.loc[unrounded_mask(df[col_name]), col_name].items():
             if isinstance(num, (int, float)) and not math.isnan(num):
                 decimal_val = Decimal(str(num))
                 if -decimal_val.as_tuple().exponent > 2:
                     new_num = round(num, 2)
-                    df.at[i, col_name] = new_num
+                    rounded[i] = new_num
                     changes.append(f"Line {i+2} \u00A0\u00A0|\u00A0\u00A0 {col_name} of {num} rounded to {new_num}")
+        if rounded:
+            df.loc[list(rounded), col_name] = list(rounded.values())
     return df, changes
 
 
@@ -57,11 +63,13 @@ def fix_vat(df: pd.DataFrame):
     if vat_col is None or vat_col not in df.columns:
         return df, []
 
-    for i, vat in df[vat_col].items():
-        if vat in VAT_CODES:
-            new_vat = VAT_CODES[vat]
-            df.at[i, vat_col] = new_vat
-            changes.append(f"Line {i+2} \u00A0\u00A0|\u00A0\u00A0 VAT Rate {vat} updated to code {new_vat}")
+    codes = df[vat_col].map(VAT_CODES)
+    vat_mask = codes.notna()
+    new_codes = codes[vat_mask].astype(int)
+
+    changes = [f"Line {i+2} \u00A0\u00A0|\u00A0\u00A0 VAT Rate {vat} updated to code {new_vat}"
+               for i, vat, new_vat in zip(new_codes.index, df.loc[vat_mask, vat_col], new_codes)]
+    df.loc[vat_mask, vat_col] = new_codes
     return df, changes
 
 
@@ -72,20 +80,71 @@ def fix_bad_char(df: pd.DataFrame) -> str:
     """
     changes = []
     for col in df.columns:
-        if df[col].dtype == object:
-            for i, val in df[col].items():
-                if isinstance(val, str):          # Avoid type error
-                    cleaned = ''.join(char for char in val if char not in BAD_CHARS)
+        if has_strings(df[col]):
+            changed, cleaned = remove_bad_chars(df[col])
 
-                    if val != cleaned:
-                        df.at[i, col] = cleaned
-                        changes.append(f"Line {i} \u00A0\u00A0|\u00A0\u00A0 Bad characters removed from column '{col}'")
+            if changed.any():
+                df.loc[changed, col] = cleaned
+                message = f" \u00A0\u00A0|\u00A0\u00A0 Bad characters removed from column '{col}'"
+                changes.extend([f"Line {i}{message}" for i in df.index[changed]])
 
     return df, changes
 
 
 
+def has_strings(column: pd.Series) -> bool:
+    """ Whether the column holds any text, so the .str methods can be used on it."""
+    if isinstance(column.dtype, pd.StringDtype):
+        return True
+    return column.dtype == object and pd.api.types.infer_dtype(column, skipna=True) in ("string", "mixed", "mixed-integer")
+
+
+
+def remove_bad_chars(column: pd.Series) -> tuple[np.ndarray, list[str]]:
+    """ Mask of the text cells that contain BAD_CHARS, and those cells with the characters removed.
+        The text cells are joined and searched once per bad character, so only the cells that need it get translated. """
+    values = column.to_numpy(dtype=object)
+    if isinstance(column.dtype, pd.StringDtype) or pd.api.types.infer_dtype(column, skipna=True) == "string":
+        is_text = column.notna().to_numpy()
+    else:
+        is_text = np.fromiter((type(value) is str for value in values), dtype=bool, count=len(values))
+
+    rows = np.flatnonzero(is_text)
+    texts = values[rows].tolist()
+    joined = "\0".join(texts)
+    hits = []
+    for char in BAD_CHARS:
+        position = joined.find(char)
+        while position != -1:
+            hits.append(position)
+            position = joined.find(char, position + 1)
+
+    changed = np.zeros(len(values), dtype=bool)
+    if not hits:
+        return changed, []
+
+    # Map each hit back to the cell it's in from where each cell starts in the joined string
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    starts = np.cumsum(lengths + 1) - (lengths + 1)
+    dirty = np.unique(np.searchsorted(starts, hits, side="right") - 1)
+
+    changed[rows[dirty]] = True
+    return changed, [texts[k].translate(BAD_CHAR_TABLE) for k in dirty]
+
+
+
+def unrounded_mask(column: pd.Series) -> pd.Series:
+    """ Numbers in the column that change when rounded to 2 decimal places."""
+    numbers = pd.to_numeric(column, errors="coerce") if column.dtype == object else column
+    if not pd.api.types.is_float_dtype(numbers):
+        return pd.Series(False, index=column.index)     # Whole numbers never need rounding
+    values = numbers.to_numpy(dtype=float, na_value=np.nan)
+    return pd.Series(np.round(values, 2) != values, index=column.index) & numbers.notna()
+
+
+
 
+@timed_stage("auto-fix")
 def update_all_products(df: pd.DataFrame):
     df = df.copy()   
     changes_by_type = {}
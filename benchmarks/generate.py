@@ -0,0 +1,155 @@
+"""
+Generate
+
+Synthetic uploads and reference files for the benchmarks. The sample spreadsheets named in contants.py aren't
+in the repo, so these stand in for them at any size and with as much mess as asked for.
+
+dirt is the chance (0 to 1) of each kind of mess on a row: bad characters, long descriptions, odd decimals,
+duplicated barcodes and codes, codes already in the CodesList and unknown suppliers.
+"""
+import os
+import csv
+import random
+from openpyxl import Workbook
+
+from utils.contants import *
+
+
+PRODUCT_HEADERS = ["PLU", "Description", "Subgroup", "3 Digit Supplier", "Season", "Supplier Code", "Cost Price",
+                   "Barcode", "VAT Rate", "RRP", "Selling Price", "STG Price", "Tariff", "Web"]
+CLOTHING_HEADERS = ["Style Code", "Description", "Size", "Colour", "Subgroup", "3 Digit Supplier", "Season", "Main Supplier",
+                    "Cost Price", "Barcode", "VAT Rate", "RRP", "Selling Price", "STG Retail Price", "Tariff Code",
+                    "Brand In Store", "Product Type", "Web", "Country Of Origin", "Country Code"]
+PRICE_AMENDMENT_HEADERS = ["PLU", "Description", "3 Digit Supplier", "Cost Price", "RRP", "Selling Price", "STG Price"]
+
+CODES_START = 100000                # CodesList PLUs are CODES_START, CODES_START + 1, ...
+BARCODES_START = 5000000000000      # and their barcodes BARCODES_START, BARCODES_START + 1, ...
+NEW_CODES_START = 90000000          # Codes for new items, never in the CodesList
+SUPPLIER_CODES = [94104, 100077, 100123, 100456, 100789]
+
+WORDS = ["Organic", "Dark", "Chocolate", "Bar", "Sea", "Salt", "Caramel", "Oat", "Biscuit", "Wool", "Jumper",
+         "Linen", "Scarf", "Ceramic", "Mug", "Irish", "Honey", "Jar", "Candle", "Lavender", "Gift", "Box"]
+COLOURS = ["Navy", "Red", "Forest Green", "Oatmeal", "Navy Blue, Dark", "Charcoal Grey Marl"]
+SIZES = ["XS", "S", "M", "L", "XL", "XXL"]
+
+
+
+def write_codes_list(path: str, rows: int):
+    """ CodesList CSV of rows PLUs and barcodes."""
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["PLU", "Barcode", "Description"])
+        for i in range(rows):
+            writer.writerow([CODES_START + i, BARCODES_START + i, f"Item {i}"])
+
+
+
+def write_supplier_list(path: str, extra_rows: int = 5000):
+    """ Supplier Code List CSV with SUPPLIER_CODES and extra_rows other suppliers."""
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Code", "Name", ""])
+        for code in SUPPLIER_CODES + list(range(200000, 200000 + extra_rows)):
+            writer.writerow([code, f"SUPPLIER {code} LTD", ""])
+
+
+
+def description(rnd: random.Random, dirt: float) -> str:
+    text = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(2, 4)))
+    if rnd.random() < dirt:
+        text = f"{text} 100% 'Irish', made by O'Neills"                     # Bad characters
+    if rnd.random() < dirt:
+        text = " ".join([text] + [rnd.choice(WORDS) for _ in range(12)])    # Over 50 characters
+    return text
+
+
+
+def price(rnd: random.Random, dirt: float) -> float:
+    value = rnd.randint(100, 9999) / 100
+    if rnd.random() < dirt:
+        value += rnd.randint(1, 9) / 1000       # More than 2 decimal places
+    return value
+
+
+
+def new_code(rnd: random.Random, i: int, dirt: float, codes: list, reference_rows: int):
+    """ Code for row i: usually new, sometimes a repeat of an earlier row or one that's already in the CodesList."""
+    roll = rnd.random()
+    if codes and roll < dirt / 2:
+        return rnd.choice(codes)
+    if reference_rows and roll < dirt:
+        return CODES_START + rnd.randrange(reference_rows)
+    return NEW_CODES_START + i
+
+
+
+def new_barcode(rnd: random.Random, i: int, dirt: float, barcodes: list, reference_rows: int):
+    """ Barcode for row i: usually new, sometimes shared with an earlier row or already in the CodesList."""
+    roll = rnd.random()
+    if barcodes and roll < dirt / 2:
+        return rnd.choice(barcodes)
+    if reference_rows and roll < dirt:
+        return BARCODES_START + rnd.randrange(reference_rows)
+    return BARCODES_START + 10 ** 9 + i
+
+
+
+def supplier(rnd: random.Random, dirt: float):
+    return rnd.choice(SUPPLIER_CODES) if rnd.random() >= dirt else rnd.randint(1, 999)
+
+
+
+def upload_rows(file_type: str, rows: int, dirt: float, reference_rows: int, seed: int):
+    """ The header and data rows of a synthetic upload."""
+    rnd = random.Random(seed)
+    codes = []
+    barcodes = []
+
+    if file_type == "Product":
+        yield PRODUCT_HEADERS
+    elif file_type == "Clothing":
+        yield CLOTHING_HEADERS
+    else:
+        yield PRICE_AMENDMENT_HEADERS
+
+    for i in range(rows):
+        code = new_code(rnd, i, dirt, codes, reference_rows)
+        barcode = new_barcode(rnd, i, dirt, barcodes, reference_rows)
+        codes.append(code)
+        barcodes.append(barcode)
+        vat = rnd.choice(list(VAT_CODES) + [0])
+        cost, rrp, sell = price(rnd, dirt), price(rnd, dirt), price(rnd, dirt)
+
+        if file_type == "Product":
+            yield [str(code), description(rnd, dirt), "GROCERY", 123, "SS", supplier(rnd, dirt), cost,
+                   str(barcode), vat, rrp, sell, price(rnd, dirt), 19059080, "Y"]
+        elif file_type == "Clothing":
+            yield [f"ST{code}", description(rnd, dirt), rnd.choice(SIZES), rnd.choice(COLOURS), "KNITWEAR", 123, "AW",
+                   supplier(rnd, dirt), cost, str(barcode), vat, rrp, sell, price(rnd, dirt), 61101130, "Avoca",
+                   "Jumper", "Y", "Ireland", "IE"]
+        else:
+            yield [str(CODES_START + rnd.randrange(max(reference_rows, 1))) if rnd.random() >= dirt else str(code),
+                   description(rnd, dirt), supplier(rnd, dirt), cost, rrp, sell, price(rnd, dirt)]
+
+
+
+def write_upload(path: str, file_type: str, rows: int, dirt: float = 0.1, reference_rows: int = 0,
+                 header_offset: int = 2, seed: int = 0):
+    """ Write a synthetic Product, Clothing or Price Amendment workbook.
+        header_offset title rows go above the header, like supplier sheets that don't start on the first row. """
+    book = Workbook(write_only=True)
+    sheet = book.create_sheet()
+    for i in range(header_offset):
+        sheet.append([f"{file_type} upload", f"Sheet generated for benchmarks ({i + 1})"])
+    for row in upload_rows(file_type, rows, dirt, reference_rows, seed):
+        sheet.append(row)
+    book.save(path)
+
+
+
+def ensure_file(path: str, write, *args, **kwargs) -> str:
+    """ Write the file with write(path, ...) unless it's already there from an earlier run."""
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        write(path, *args, **kwargs)
+    return path
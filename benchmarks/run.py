@@ -0,0 +1,166 @@
+"""
+Run
+
+Time each stage of the validation pipeline on generated files and keep a history of the results:
+
+    python -m benchmarks.run --type Product --rows 20000 --dirt 0.1
+
+Each run is appended to benchmarks/results.jsonl with the commit it ran on. A stage that's more than
+--tolerance slower than the last run with the same settings is reported as a regression.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+from pipeline import *
+from utils.ingest import read_sheet_rows, parse_rows
+from benchmarks.generate import *
+
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCHMARK_DIR, "data")
+RESULTS_FILE = os.path.join(BENCHMARK_DIR, "results.jsonl")
+STAGES = ["ingest", "header detect", "reference", "auto-fix", "load", "validate", "recheck", "recheck fixed", "export"]
+FIXED_ROWS = 0.01      # Share of the rows changed for "recheck fixed", like a supplier fixing a few rows and uploading again
+
+
+
+def timed(func, *args, **kwargs):
+    """ Run func once and return its result and how long it took in seconds."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+
+def run_pipeline(upload: str, file_type: str, codes_list: str, supplier_list: str) -> dict[str, float]:
+    """ One pass of the pipeline on upload, with each stage's time in seconds. "validate" is check_upload, as in
+        validate_batch.py, and "recheck" is recheck_upload, as in interface.py. "recheck fixed" is recheck_upload
+        again on the same upload with FIXED_ROWS of its codes changed, so only those rows are checked again. """
+    map_name, update_all, _ = PIPELINES[file_type]
+    header_map = HEADER_MAPS[map_name]
+    expected_headers = [name for sublist in header_map.values() for name in sublist]
+    times = {}
+
+    def ingest():
+        rows = read_sheet_rows(upload)
+        return rows, parse_rows(rows[:10], header=None)
+    (rows, preview), times["ingest"] = timed(ingest)
+    header_row, times["header detect"] = timed(find_header_row, preview, expected_headers, 10)
+    df, seconds = timed(parse_rows, rows, header_row)
+    times["ingest"] += seconds
+    df.columns = [normalize_header(c) for c in df.columns]
+
+    # Imported into a new store every run, so neither the saved store nor load_reference's cache hides the time it takes
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as store_dir:    # Windows won't delete mapped arrays
+        (reference, _), times["reference"] = timed(load_reference, codes_list, supplier_list,
+                                                   os.path.join(store_dir, "reference.sqlite3"), None)
+
+        (df, _), times["auto-fix"] = timed(update_all, df)
+        (records, _), times["load"] = timed(load_upload, df, file_type)
+        _, times["validate"] = timed(check_upload, df, records, file_type, reference)
+
+        revisions = {}
+        _, times["recheck"] = timed(recheck_upload, df, file_type, reference, revisions)
+        _, times["recheck fixed"] = timed(recheck_upload, fixed_upload(df, file_type), file_type, reference, revisions)
+        _, times["export"] = timed(excel_bytes, df)
+    return times
+
+
+
+def fixed_upload(df: pd.DataFrame, file_type: str) -> pd.DataFrame:
+    """ A copy of df with the code of every 1 / FIXED_ROWS-th row changed."""
+    col_map, _ = resolve_headers(df, PIPELINES[file_type][0])
+    col = col_map.get("plu_code") or col_map.get("style_code")
+    fixed = df.copy()
+    rows = fixed.index[::max(int(1 / FIXED_ROWS), 1)]
+    fixed[col] = fixed[col].astype(object)
+    fixed.loc[rows, col] = [f"{code}F" for code in fixed.loc[rows, col]]
+    return fixed
+
+
+
+def git_commit() -> str | None:
+    """ The commit the benchmark ran on, or None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+
+def load_results(path: str = RESULTS_FILE) -> list[dict]:
+    """ Every recorded run, oldest first."""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+
+def save_result(result: dict, path: str = RESULTS_FILE):
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(json.dumps(result) + "\n")
+
+
+
+def regressions(result: dict, history: list[dict], tolerance: float, min_change: float = 0.005) -> dict[str, tuple[float, float]]:
+    """ Stages that are more than tolerance (e.g. 0.2 for 20%) slower than in the last run with the same settings,
+        as stage -> (last time, this time). Changes under min_change seconds are timer noise and aren't counted. """
+    previous = next((run for run in reversed(history) if run["settings"] == result["settings"]), None)
+    if previous is None:
+        return {}
+    return {stage: (previous["times"][stage], seconds) for stage, seconds in result["times"].items()
+            if stage in previous["times"] and seconds > previous["times"][stage] * (1 + tolerance)
+            and seconds - previous["times"][stage] >= min_change}
+
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Time each stage of the validation pipeline on generated files.")
+    parser.add_argument("--type", dest="file_type", choices=list(PIPELINES), default="Product", help="Upload type to generate")
+    parser.add_argument("--rows", type=int, default=5000, help="Rows in the upload")
+    parser.add_argument("--codes", type=int, default=200000, help="Rows in the CodesList")
+    parser.add_argument("--dirt", type=float, default=0.1, help="Chance of each kind of mess on a row, 0 to 1")
+    parser.add_argument("--header-offset", type=int, default=2, help="Title rows above the header")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs to take the fastest time of for each stage")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="How much slower a stage can get before it's a regression")
+    parser.add_argument("--results", default=RESULTS_FILE, help="JSON lines file the results are added to")
+    parser.add_argument("--no-save", action="store_true", help="Don't add this run to the results")
+    args = parser.parse_args(argv)
+
+    settings = {"file_type": args.file_type, "rows": args.rows, "codes": args.codes, "dirt": args.dirt,
+                "header_offset": args.header_offset, "seed": args.seed}
+    name = f"{args.file_type.replace(' ', '_')}_{args.rows}_{args.dirt}_{args.header_offset}_{args.seed}"
+    codes_list = ensure_file(os.path.join(DATA_DIR, f"codes_{args.codes}.csv"), write_codes_list, args.codes)
+    supplier_list = ensure_file(os.path.join(DATA_DIR, "suppliers.csv"), write_supplier_list)
+    upload = ensure_file(os.path.join(DATA_DIR, f"{name}.xlsx"), write_upload, args.file_type, args.rows,
+                         args.dirt, args.codes, args.header_offset, args.seed)
+
+    runs = [run_pipeline(upload, args.file_type, codes_list, supplier_list) for _ in range(args.repeat)]
+    times = {stage: round(min(run[stage] for run in runs), 4) for stage in STAGES}
+    result = {"date": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+              "python": sys.version.split()[0], "pandas": pd.__version__, "settings": settings, "times": times}
+
+    slower = regressions(result, load_results(args.results), args.tolerance)
+    print(f"{args.file_type}, {args.rows} rows, {args.codes} codes, dirt {args.dirt} (best of {args.repeat})")
+    for stage, seconds in times.items():
+        flag = f"  REGRESSION, was {slower[stage][0]:.4f}s" if stage in slower else ""
+        print(f"  {stage:<14}{seconds:>9.4f}s{flag}")
+    print(f"  {'total':<14}{sum(times.values()):>9.4f}s")
+
+    if not args.no_save:
+        save_result(result, args.results)
+    return 1 if slower else 0
+
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,8 +1,8 @@
-import streamlit as st
-
-
-
 class Clothing:
+    __slots__ = ("style_code", "description", "size", "colour", "subgroup", "supplier_code", "season",
+                 "main_supplier", "cost", "barcode", "vat_rate", "rrp", "sell_price", "stg_price", "tariff",
+                 "brand", "product_type", "web", "country", "country_code", "excel_line")
+
     def __init__(self, code, description, size, colour, subgroup, supplier_code, season, 
                  main_supplier, cost_price, barcode, vat_rate, rrp, sell_price, stg_price, 
                  tariff, brand, product_type, web, country, country_code, idx=None):
@@ -1,7 +1,6 @@
-import streamlit as st
-
-
 class Price_Amend:
+    __slots__ = ("plu_code", "description", "main_supplier", "cost", "rrp", "sell_price", "stg_price", "excel_line")
+
     def __init__(self, code, description, main_supplier, cost_price, rrp, sell_price, stg_price, idx=None):
         self.plu_code = code
         self.description = description
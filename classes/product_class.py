@@ -1,7 +1,7 @@
-import streamlit as st
-
-
 class Product:
+    __slots__ = ("plu_code", "description", "subgroup", "supplier_code", "season", "main_supplier", "cost",
+                 "barcode", "vat_rate", "rrp", "sell_price", "stg_price", "tariff", "web", "excel_line")
+
     def __init__(self, code, description, subgroup, supplier_code, season, 
                  main_supplier, cost_price, barcode, vat_rate, rrp, sell_price, stg_price, tariff, web, idx=None):
         self.plu_code = code
@@ -9,45 +9,55 @@ from utils.normalizer import *
 
 
 
+def column_values(df: pd.DataFrame, col_map: dict, keys) -> list[list]:
+    """ Pull each resolved column out of df once as a plain list.
+        The first key is the item code and gets normalized as a whole column. Missing columns are all None. """
+    columns = []
+    for key in keys:
+        col = col_map[key]
+        if col is None:
+            columns.append([None] * len(df))
+        else:
+            columns.append(df[col].tolist())
+
+    code_col = col_map[keys[0]]
+    if code_col is None:
+        columns[0] = [normalizer(None)] * len(df)
+    else:
+        columns[0] = df[code_col].astype(object).map(str).str.strip().tolist()  # Same as normalizer() per cell
+    return columns
+
+
+
+def line_numbers(df: pd.DataFrame) -> list[int]:
+    """ Excel line of every row in df (+2 for the header row and 0-indexing)."""
+    return (df.index + 2).tolist()
+
+
+
+ARGUMENT_NAMES = {"plu_code": "code", "style_code": "code"}     # Header keys named differently from the class's argument
+
+
+
+def build_records(record_class, df: pd.DataFrame, col_map: dict, header_map: dict) -> list:
+    """ A record_class object for every row of df, built column by column. Each header key is passed as the
+        keyword argument of the same name (or its ARGUMENT_NAMES one), so the header map can be in any order. """
+    keys = list(header_map)
+    names = [ARGUMENT_NAMES.get(key, key) for key in keys] + ["idx"]
+    columns = column_values(df, col_map, keys)
+    return [record_class(**dict(zip(names, values))) for values in zip(*columns, line_numbers(df))]
+
+
+
 def load_products(df: pd.DataFrame) -> tuple[list[Product], list[tuple[str, str]]]:
     """Load the new product file into a list of Product class objects"""
     # expected_headers = [name for sublist in PRODUCT_HEADER_MAP.values() for name in sublist]
 
-    messages = []
-    
     # Pre-resolve all needed column names
-    used_columns = set()
-    col_map = {}
-    for key in PRODUCT_HEADER_MAP:
-        col, message, type = find_header(df, PRODUCT_HEADER_MAP[key], used_columns)
-        if col:
-            used_columns.add(col)
-        col_map[key] = col  # May be None if not found
-        if message:
-            messages.append((message, type))
-
-    # Build Product objects using resolved column names
-    products = []
-    for idx, row in df.iterrows():
-        line_number = idx + 2
-        product = Product(
-            code = normalizer(row.get(col_map["plu_code"])),
-            description = row.get(col_map["description"]),
-            subgroup = row.get(col_map["subgroup"]),
-            supplier_code = row.get(col_map["supplier_code"]),
-            season = row.get(col_map["season"]),
-            main_supplier = row.get(col_map["main_supplier"]),
-            cost_price = row.get(col_map["cost_price"]),
-            barcode = row.get(col_map["barcode"]),
-            vat_rate = row.get(col_map["vat_rate"]),
-            rrp = row.get(col_map["rrp"]),
-            sell_price = row.get(col_map["sell_price"]),
-            stg_price = row.get(col_map["stg_price"]),
-            tariff = row.get(col_map["tariff"]),
-            web = row.get(col_map["web"]),
-            idx = line_number
-        )
-        products.append(product)
+    col_map, messages = resolve_headers(df, "product")
+    require_columns(col_map, REQUIRED_COLUMNS["product"])
+
+    products = build_records(Product, df, col_map, PRODUCT_HEADER_MAP)
 
     return products, messages
 
@@ -60,59 +70,29 @@ def load_clothing(df: pd.DataFrame) -> tuple[list[Clothing], list[tuple[str, str
     # df.columns = df.columns.str.lower().str.strip().str.replace(" ", "")
     # df.columns = [normalize_header(col) for col in df.columns]
 
-    messages = []
-    col_map = {}
-    used_columns = set()
-
     # # Step 1: Resolve headers
-    for key in CLOTHING_HEADER_MAP:
-        col, message, type = find_header(df, CLOTHING_HEADER_MAP[key], used_columns)
-        if col:
-            used_columns.add(col)
-        col_map[key] = col  # May be None if not found
-        if message:
-            messages.append((message, type))
+    col_map, messages = resolve_headers(df, "clothing")
 
 
 
     # Step 2: Check for required columns
-    for key, col in col_map.items():
-        if col is None and key in ["style_code", "description"]:  # Add more keys if needed
-            raise ValueError(f"Missing required column: {key}")
+    require_columns(col_map, REQUIRED_COLUMNS["clothing"])
 
     # Step 3: Build clothing objects
-    clothes = []
-    for idx, row in df.iterrows():
-        line_number = idx + 2
-        clothing = Clothing(
-            code=normalizer(row.get(col_map["style_code"])),
-            description=row.get(col_map["description"]),
-            size=row.get(col_map["size"]),
-            colour=row.get(col_map["colour"]),
-            subgroup=row.get(col_map["subgroup"]),
-            supplier_code=row.get(col_map["supplier_code"]),
-            season=row.get(col_map["season"]),
-            main_supplier=row.get(col_map["main_supplier"]),
-            cost_price=row.get(col_map["cost_price"]),
-            barcode=row.get(col_map["barcode"]),
-            vat_rate=row.get(col_map["vat_rate"]),
-            rrp=row.get(col_map["rrp"]),
-            sell_price=row.get(col_map["sell_price"]),
-            stg_price=row.get(col_map["stg_price"]),
-            tariff=row.get(col_map["tariff"]),
-            brand=row.get(col_map["brand"]),
-            product_type=row.get(col_map["product_type"]),
-            web=row.get(col_map["web"]),
-            country=row.get(col_map["country"]),
-            country_code=row.get(col_map["country_code"]),
-            idx=line_number
-        )
-        clothes.append(clothing)
+    clothes = build_records(Clothing, df, col_map, CLOTHING_HEADER_MAP)
 
     return clothes, messages
 
 
 
+def require_columns(col_map: dict, keys: list[str]):
+    """ Raise a ValueError for the first of keys that couldn't be resolved to a column."""
+    for key, col in col_map.items():
+        if col is None and key in keys:
+            raise ValueError(f"Missing required column: {key}")
+
+
+
 def read_column(df: pd.DataFrame, possible_names, used_columns=None) -> list:
     """Find the given column name and return that column as a list.
     Converts all objects to strings"""
@@ -134,34 +114,11 @@ def load_prices(df: pd.DataFrame) -> tuple[list[Product], list[tuple[str, str]]]
     """Load the new product file into a list of Product class objects"""
     # expected_headers = [name for sublist in PRODUCT_HEADER_MAP.values() for name in sublist]
 
-    messages = []
-    
     # Pre-resolve all needed column names
-    used_columns = set()
-    col_map = {}
-    for key in PRICE_AMENDMENT_HEADER_MAP:
-        col, message, type = find_header(df, PRICE_AMENDMENT_HEADER_MAP[key], used_columns)
-        if col:
-            used_columns.add(col)
-        col_map[key] = col  # May be None if not found
-        if message:
-            messages.append((message, type))
-
-    # Build Product objects using resolved column names
-    products = []
-    for idx, row in df.iterrows():
-        line_number = idx + 2
-        product = Price_Amend(
-            code = normalizer(row.get(col_map["plu_code"])),
-            description = row.get(col_map["description"]),
-            main_supplier = row.get(col_map["main_supplier"]),
-            cost_price = row.get(col_map["cost_price"]),
-            rrp = row.get(col_map["rrp"]),
-            sell_price = row.get(col_map["sell_price"]),
-            stg_price = row.get(col_map["stg_price"]),
-            idx = line_number
-        )
-        products.append(product)
+    col_map, messages = resolve_headers(df, "price_amendment")
+    require_columns(col_map, REQUIRED_COLUMNS["price_amendment"])
+
+    products = build_records(Price_Amend, df, col_map, PRICE_AMENDMENT_HEADER_MAP)
 
     return products, messages
 
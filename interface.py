@@ -1,12 +1,8 @@
 import pandas as pd
 import streamlit as st
-import io
+from functools import partial
 
-from converter import * 
-from auto_fixes.fix_products import update_all_products
-from auto_fixes.fix_clothing import update_all_clothing
-from utils.validators import *
-from utils.headers import *
+from pipeline import *
 
 def display_results(title: str, errors: list[str]):
     if errors: 
@@ -24,8 +20,22 @@ file_type = st.selectbox("Select File Type", ["Product", "Clothing", "Price Amen
 
 # File uploads
 new_file = st.file_uploader(f"Upload New {file_type} File", type=["xlsx", "csv"],  key=f"upload_{file_type.lower()}")
-full_list_file = "1_Spreadsheets/CodesList.csv"
-full_supplier_file = "1_Spreadsheets/Supplier Code List.CSV"
+full_list_file = FULL_LIST_FILE
+full_supplier_file = SUPPLIER_LIST_FILE
+
+# Time each step of the checks, shown at the bottom of the page and logged
+show_performance = st.checkbox("Show performance", key="show_performance",
+                               help="Time each step and measure its peak memory. Every step runs again each time, and measuring memory makes the checks slower.")
+log_stages()
+performance = PerformanceRun(new_file.name if new_file else "", memory=show_performance).start()
+
+# Results of the uploads already checked this session, by file type and contents.
+# Every click reruns this script, so without these each one would read and check the file again.
+# Not used while timing the steps, so there's something to time.
+upload_results = {} if show_performance else st.session_state.setdefault("upload_results", {})
+upload = upload_key(new_file.getvalue(), file_type) if new_file else None
+# What the checks found on the last upload of each type, so a re-upload with a few rows fixed only checks those rows
+revisions = {} if show_performance else st.session_state.setdefault("upload_revisions", {})
 
 
 # Proceed only if both files uploaded
@@ -33,23 +43,16 @@ if file_type == "Product" and new_file and full_list_file and full_supplier_file
 
 # Step 1: Read and normalize new product file for auto fixes ---------
     try:
-        expected_headers = [name for sublist in PRODUCT_HEADER_MAP.values() for name in sublist]
-        header_row = detect_header_row(new_file, expected_headers)
-        df = pd.read_excel(new_file, header=header_row)
-        df.columns = [normalize_header(c) for c in df.columns]
+        # Read, check columns and apply auto-changes
+        df, auto_changes, missing, unrecognized = cached_step(upload_results, upload, "prepare", prepare_upload, new_file, file_type)
 
-        missing = check_missing_headers(df, PRODUCT_HEADER_MAP)                         # Check missing columns
-        if not missing:
+        if not missing:                                                                 # Check missing columns
             st.success(f"All expected columns found in new file.")
         
     # Keep track of unrecognized header names
-        unrecognized = unexpected_headers(df, PRODUCT_HEADER_MAP)
         if unrecognized:
             st.info(f"Unrecognized columns in file: {', '.join(unrecognized)}")
 
-    # Apply auto-changes
-        df, auto_changes = update_all_products(df)                       
-
     except Exception as e:
         st.error(f"Error reading or fixing new product file: {e}. Excel format may be incorrect.")
         with open("1_Spreadsheets/Upload Template Types.xlsx", "rb") as file:
@@ -61,9 +64,9 @@ if file_type == "Product" and new_file and full_list_file and full_supplier_file
                 )
         st.stop()
 
-# Step 2: Load as Product class objects ----------
+# Step 2: Match the columns to the template ----------
     try:
-        products, messages = load_products(df) # was new file
+        _, messages = cached_step(upload_results, upload, "load", load_upload, df, file_type, False)    # recheck_upload only uses the frame
         missing = []
         for message, type in messages:
             if type == "alert":
@@ -89,17 +92,10 @@ if file_type == "Product" and new_file and full_list_file and full_supplier_file
 # Step 3: Load PLU, Barcode list ---------
     try:
         # full_list_df = pd.read_excel(full_list_file)
-        full_list_df = pd.read_csv(full_list_file)
-        full_list_df.columns = [normalize_header(column) for column in full_list_df.columns]
-        full_list_barcode, message, type = read_column(full_list_df, PRODUCT_HEADER_MAP["barcode"], used_columns=None)
-        full_list_plu, message, type = read_column(full_list_df, PRODUCT_HEADER_MAP["plu_code"], used_columns=None)
-    
-        full_supplier_df = pd.read_csv(full_supplier_file)
-        full_supplier_codes = full_supplier_df.iloc[:, 0].dropna().tolist()
-
+        reference, messages = load_reference(full_list_file, full_supplier_file)
 
         missing = []
-        if message:
+        for message, type in messages:
             if type == "alert":
                 st.success(message)
             elif type == "error":
@@ -113,54 +109,28 @@ if file_type == "Product" and new_file and full_list_file and full_supplier_file
     except Exception as e:
         st.error(f"Error reading PLU Active List: {e}")
         st.stop()
-    
+
 
 # Step 4: Check for errors
     st.header("Checks")
 
 
-    duplicate_plu_dict = check_duplicates(products, full_list_plu, "plu_code")
-    duplicate_plu_errors = [
-        f"Line: {line + 2} \u00A0\u00A0|\u00A0\u00A0 Product {plu} is already in the system."  # +2 to match Excel row (header + 0-indexed)
-        for plu, line in duplicate_plu_dict.items()
-    ]
-    internal_duplicates = check_internal_duplicates(products, "plu_code")
-    prod_barcode__internal_errors = duplicate_internal_barcodes(products, "plu_code")
-
-    full_prod_barcode_errors = check_duplicates(products, full_list_barcode, "barcode")
-    duplicate_barcode_errors = [
-        f"Line: {line + 2} \u00A0\u00A0|\u00A0\u00A0  Barcode {barcode} is already in the system."  # +2 to match Excel row (header + 0-indexed)
-        for barcode, line in full_prod_barcode_errors.items()
-    ]
-    plu_in_barcodes = check_duplicates(products, full_list_barcode, "plu_code")
-    barcodes_in_plu = check_duplicates(products, full_list_plu, "barcode")
-    plu_errors = []
-    prod_bad_char_errors = []
-    supplier_exists = check_exist(products, full_supplier_codes, "main_supplier")
-
-    
-
-# Check all products and store in proper lists
-    for product in products:
-        if (e := product.plu_len()):
-            plu_errors.append(e)
+    errors, skipped = cached_step(upload_results, upload, "check", recheck_upload, df, file_type, reference, revisions,
+                                   depends=reference)
+    if skipped:
+        st.info(f"Skipped checks, their columns weren't found: {', '.join(skipped)}")
+
         
 # If no errors
-    if any([duplicate_plu_errors, internal_duplicates, plu_errors, 
-                prod_barcode__internal_errors, duplicate_barcode_errors, 
-                plu_in_barcodes, barcodes_in_plu, supplier_exists]):
+    if any(errors.values()):
         st.header("Unresolved Errors")
         
-        display_results("Duplicate PLU Code Errors", duplicate_plu_errors)
-        display_results("Duplicate PLUs Within Uploaded File", internal_duplicates)
-        display_results("PLU Code Length Errors", plu_errors)
-        display_results("Duplicate Barcode Within New Upload", prod_barcode__internal_errors)
-        display_results("Duplicate Barcodes In Database", duplicate_barcode_errors)
-        display_results("Duplicate PLU's Used As Existing Barcodes", plu_in_barcodes)
-        display_results("Duplicate Barcodes Used As Existing PLU's", barcodes_in_plu)
-        display_results("Check If Supplier Code Exists", supplier_exists)
+        for title, title_errors in errors.items():
+            display_results(title, title_errors)
         
 # Display errors
+    elif skipped:
+        st.warning("No errors found, but not every check could run. Add the missing columns before uploading.")
     else:
         st.success("All checks passed. File is ready for upload.")
 
@@ -177,15 +147,17 @@ if file_type == "Product" and new_file and full_list_file and full_supplier_file
                     for change in changes:
                         st.markdown(f"- {change}")
 
-        # Convert to Excel in memory
-        buffer = io.BytesIO()
-        df.to_excel(buffer, index=False)
-
+        # Only written when a download button is clicked
         st.download_button(
             label="Download Fixed Version",
-            data=buffer.getvalue(),
+            data=partial(cached_step, upload_results, upload, "export", excel_bytes, df),
             file_name= f"Fixed-{new_file.name}.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        st.download_button(
+            label="Download Fixed Version (CSV)",
+            data=partial(cached_step, upload_results, upload, "export csv", csv_bytes, df),
+            file_name= f"Fixed-{new_file.name}.csv",
+            mime="text/csv")
 
     else:
         st.success("No Auto-changes needed.")
@@ -198,24 +170,17 @@ elif file_type == "Clothing" and new_file and full_list_file and full_supplier_f
 # Step 1: Read and normalize new clothing file for auto fixes ---------
 
     try:
-        expected_headers = [name for sublist in CLOTHING_HEADER_MAP.values() for name in sublist]
-        header_row = detect_header_row(new_file, expected_headers)
-        df = pd.read_excel(new_file, header=header_row)
-        df.columns = [normalize_header(c) for c in df.columns]
+        # Read, check columns and apply auto fixes
+        df, auto_changes, missing, unrecognized = cached_step(upload_results, upload, "prepare", prepare_upload, new_file, file_type)
 
-        missing = check_missing_headers(df, CLOTHING_HEADER_MAP)                         # Check missing columns
-        if missing:
+        if missing:                                                                     # Check missing columns
             st.warning(f"Columns not found in new file: {', '.join(missing)}")
         else:
             st.success(f"All expected columns found in new file.")
         
     # Keep track of unrecognized header names
-        unrecognized = unexpected_headers(df, CLOTHING_HEADER_MAP)
         if unrecognized:
             st.info(f"Unrecognized columns in file: {', '.join(unrecognized)}")
-
-    # Apply auto fixes
-        df, auto_changes = update_all_clothing(df)         
     except Exception as e:
         st.error(f"Error reading or fixing new clothing file: {e}. Excel format may be incorrect.")
         with open("1_Spreadsheets/Upload Template Types.xlsx", "rb") as file:
@@ -227,9 +192,9 @@ elif file_type == "Clothing" and new_file and full_list_file and full_supplier_f
             )
         st.stop()
 
-# Step 2: Load as Clothing class objects ----------
+# Step 2: Match the columns to the template ----------
     try:
-        clothes, messages = load_clothing(df)
+        _, messages = cached_step(upload_results, upload, "load", load_upload, df, file_type, False)    # recheck_upload only uses the frame
         missing = []
         for message, type, in messages:
             if type == "alert":
@@ -254,15 +219,9 @@ elif file_type == "Clothing" and new_file and full_list_file and full_supplier_f
 # Step 3: Load Clothing list ---------
     try:
         # full_list_df = pd.read_excel(full_list_file)
-        full_list_df = pd.read_csv(full_list_file)
-        full_list_df.columns = [normalize_header(c) for c in full_list_df.columns]
-        full_list_barcode, message, type = read_column(full_list_df, CLOTHING_HEADER_MAP["barcode"])
-        full_list_style, message, type = read_column(full_list_df, PRODUCT_HEADER_MAP["plu_code"])
-
-        full_supplier_df = pd.read_csv(full_supplier_file)
-        full_supplier_codes = full_supplier_df.iloc[:, 0].dropna().tolist()
+        reference, messages = load_reference(full_list_file, full_supplier_file)
 
-        if message:
+        for message, type in messages:
             if type == "alert":
                 st.success(message)
             elif type == "error":
@@ -280,44 +239,21 @@ elif file_type == "Clothing" and new_file and full_list_file and full_supplier_f
     st.header("Checks")
 
 
-    duplicate_styles = check_duplicates(clothes, full_list_style, "style_code")
-    duplicate_style_errors = [
-        f"Line: {line + 2} \u00A0\u00A0|\u00A0\u00A0 Item {style_code} is already in the system."  # +2 to match Excel row (header + 0-indexed)
-        for style_code, line in duplicate_styles.items()
-    ]
-    internal_duplicates = check_clothing_duplicates(clothes)
-    clothing_barcode_errors = duplicate_internal_barcodes(clothes, "style_code")
-    full_clothing_barcode_errors = check_duplicates(clothes, full_list_barcode, "barcode")
-    style_code_in_barcodes = check_duplicates(clothes, full_list_barcode, "style_code")
-    barcodes_in_style_code = check_duplicates(clothes, full_list_style, "barcode")
-    style_len_errors = []
-    clothing_bad_char_errors =[]
-    supplier_exists = check_exist(clothes, full_supplier_codes, "main_supplier")
-
-    
-
-# Check all items and store in proper lists
-    for item in clothes:
-        if (e := item.style_len()):
-            style_len_errors.append(e)
+    errors, skipped = cached_step(upload_results, upload, "check", recheck_upload, df, file_type, reference, revisions,
+                                   depends=reference)
+    if skipped:
+        st.info(f"Skipped checks, their columns weren't found: {', '.join(skipped)}")
 
 
-    if any([duplicate_style_errors, internal_duplicates, style_len_errors, 
-        clothing_bad_char_errors, clothing_barcode_errors, style_code_in_barcodes, 
-        barcodes_in_style_code, full_clothing_barcode_errors, supplier_exists]):
+    if any(errors.values()):
 # Display Errors
-        display_results("All Duplicate Style Code Code Errors", duplicate_style_errors)
-        display_results("Duplicate Style Codes Within Uploaded File", internal_duplicates)
-        display_results("All Style Code Length Errors", style_len_errors)
-        display_results("All Unusable Character Errors", clothing_bad_char_errors)
-        display_results("All Duplicate Barcode Errors Within New File", clothing_barcode_errors)
-        display_results("Duplicate Barcodes In Database", full_clothing_barcode_errors)
-        display_results("Duplicate Style Codes Used As Existing Barcodes", style_code_in_barcodes)
-        display_results("Duplicate Barcodes Used As Existing Style Codes", barcodes_in_style_code)
-        display_results("Check If Supplier Code Exists", supplier_exists)
+        for title, title_errors in errors.items():
+            display_results(title, title_errors)
 
 
 # If no errors
+    elif skipped:
+        st.warning("No errors found, but not every check could run. Add the missing columns before uploading.")
     else:
         st.success("All checks passed. File is ready for upload.")
 
@@ -335,15 +271,19 @@ elif file_type == "Clothing" and new_file and full_list_file and full_supplier_f
                     for change in changes:
                         st.markdown(f"- {change}")
 
-        # Convert to Excel in memory
-        buffer = io.BytesIO()
-        df.to_excel(buffer, index=False)
+        # Only written when a download button is clicked
         st.download_button(
             label="Download Fixed Version",
-            data=buffer.getvalue(),
+            data=partial(cached_step, upload_results, upload, "export", excel_bytes, df),
             file_name= f"Fixed-{new_file.name}.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
+        st.download_button(
+            label="Download Fixed Version (CSV)",
+            data=partial(cached_step, upload_results, upload, "export csv", csv_bytes, df),
+            file_name= f"Fixed-{new_file.name}.csv",
+            mime="text/csv"
+        )
     else:
         st.success("No Auto-changes needed.")
 
@@ -354,24 +294,16 @@ elif file_type == "Price Amendment" and new_file and full_list_file and full_sup
 
 # Step 1: Read into dataframe, normalize headers, auto fixes
     try:
-            expected_headers = [name for sublist in PRICE_AMENDMENT_HEADER_MAP.values() for name in sublist]
-            header_row = detect_header_row(new_file, expected_headers)
-            df = pd.read_excel(new_file, header=header_row)
-            df.columns = [normalize_header(c) for c in df.columns]
+            # Read, check columns and apply auto-changes
+            df, auto_changes, missing, unrecognized = cached_step(upload_results, upload, "prepare", prepare_upload, new_file, file_type)
 
-            missing = check_missing_headers(df, PRICE_AMENDMENT_HEADER_MAP)                         # Check missing columns
-            if not missing:
+            if not missing:                                                             # Check missing columns
                 st.success(f"All expected columns found in new file.")
             
         # Keep track of unrecognized header names
-            unrecognized = unexpected_headers(df, PRICE_AMENDMENT_HEADER_MAP)
             if unrecognized:
                 st.info(f"Unrecognized columns in file: {', '.join(unrecognized)}")
 
-
-        # Apply auto-changes
-            df, auto_changes = update_all_products(df)                       
-
     except Exception as e:
         st.error(f"Error reading or fixing new product file: {e}. Excel format may be incorrect.")
         with open("1_Spreadsheets/Upload Template Types.xlsx", "rb") as file:
@@ -384,9 +316,9 @@ elif file_type == "Price Amendment" and new_file and full_list_file and full_sup
         st.stop()
 
 
-# Step 2: Load as Product class objects ----------
+# Step 2: Match the columns to the template ----------
     try:
-        products, messages = load_prices(df) # was new file
+        _, messages = cached_step(upload_results, upload, "load", load_upload, df, file_type, False)    # recheck_upload only uses the frame
         missing = []
         for message, type in messages:
             if type == "alert":
@@ -411,15 +343,10 @@ elif file_type == "Price Amendment" and new_file and full_list_file and full_sup
 # Step 3: Load PLU list ---------
     try:
         # full_list_df = pd.read_excel(full_list_file)
-        full_list_df = pd.read_csv(full_list_file)
-        full_list_df.columns = [normalize_header(column) for column in full_list_df.columns]
-        full_list_plu, message, type = read_column(full_list_df, PRODUCT_HEADER_MAP["plu_code"], used_columns=None)
-        
-        full_supplier_df = pd.read_csv(full_supplier_file)
-        full_supplier_codes = full_supplier_df.iloc[:, 0].dropna().tolist()
+        reference, messages = load_reference(full_list_file, full_supplier_file)
 
         missing = []
-        if message:
+        for message, type in messages:
             if type == "alert":
                 st.success(message)
             elif type == "error":
@@ -439,13 +366,17 @@ elif file_type == "Price Amendment" and new_file and full_list_file and full_sup
     st.header("Checks")
 
 
-    plu_exists = check_exist(products, full_list_plu, "plu_code")
-    supplier_exists = check_exist(products, full_supplier_codes, "main_supplier")
+    errors, skipped = cached_step(upload_results, upload, "check", recheck_upload, df, file_type, reference, revisions,
+                                   depends=reference)
+    if skipped:
+        st.info(f"Skipped checks, their columns weren't found: {', '.join(skipped)}")
 
-    if any([plu_exists, supplier_exists]):
-        display_results("Check if PLU code exists", plu_exists)
-        display_results("Check if supplier code exists", supplier_exists)
+    if any(errors.values()):
+        for title, title_errors in errors.items():
+            display_results(title, title_errors)
 
+    elif skipped:
+        st.warning("No errors found, but not every check could run. Add the missing columns before uploading.")
     else:
         st.success("All checks passed. File is ready for upload.")
 
@@ -463,6 +394,8 @@ elif file_type == "Price Amendment" and new_file and full_list_file and full_sup
 
 
 
-
-
-
+# Performance ------------------
+performance.stop()
+if show_performance and performance.stages:
+    with st.expander(f"Performance — {performance.total():.2f}s", expanded=False):
+        st.dataframe(performance.as_frame(), hide_index=True)
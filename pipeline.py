@@ -0,0 +1,333 @@
+"""
+Pipeline
+
+The Product, Clothing and Price Amendment validation pipelines without any Streamlit,
+so they can be used by interface.py and by the batch CLI in validate_batch.py.
+"""
+import os
+import io
+import hashlib
+import pandas as pd
+from openpyxl import Workbook
+
+try:
+    import xlsxwriter       # Optional, writes large workbooks faster than openpyxl
+except ImportError:
+    xlsxwriter = None
+
+from converter import *
+from auto_fixes.fix_products import update_all_products
+from auto_fixes.fix_clothing import update_all_clothing
+from utils.validators import *
+from utils.headers import *
+from utils.reference import Reference
+from utils.reference_store import load_reference
+from utils.ingest import read_upload, iter_upload, parse_cells
+from utils.frame_validators import *
+from utils.rules import *
+from utils.incremental import IncrementalColumns
+from utils.performance import PerformanceRun, timed_stage, log_stages
+
+
+
+def prepare_upload(file, file_type: str) -> tuple[pd.DataFrame, dict, list[str], list[str]]:
+    """ Step 1: Read the upload, normalize its headers and apply the auto-fixes.
+        Returns the fixed frame, the auto changes, and the missing and unrecognized columns. """
+    map_name, update_all, *_ = PIPELINES[file_type]
+    header_map = HEADER_MAPS[map_name]
+    expected_headers = [name for sublist in header_map.values() for name in sublist]
+    df, header_row = read_upload(file, expected_headers)
+    df.columns = [normalize_header(c) for c in df.columns]
+
+    missing = check_missing_headers(df, header_map)
+    unrecognized = unexpected_headers(df, header_map) or []
+    df, auto_changes = update_all(df)
+    return df, auto_changes, missing, unrecognized
+
+
+
+def stream_upload(file, file_type: str, chunk_size: int = STREAM_CHUNK_ROWS):
+    """ Steps 1 and 2 for uploads too large to hold in memory. The upload is read and auto-fixed chunk_size rows at
+        a time, and only the cells of the columns the checks read are kept from each chunk, so the whole sheet is never
+        in memory.
+        Returns those columns as one frame (indexed by row, like prepare_upload's), the header map they were resolved
+        with, the auto changes, the missing and unrecognized columns, and the messages from resolving the headers.
+        The checks find the same errors as on the whole sheet. The auto changes are listed a chunk at a time. """
+    map_name, update_all, _ = PIPELINES[file_type]
+    header_map = HEADER_MAPS[map_name]
+    expected_headers = [name for sublist in header_map.values() for name in sublist]
+    cells, fixes, auto_changes = [], [], {}
+    for chunk, chunk_cells in iter_upload(file, expected_headers, chunk_size, raw=True):
+        chunk.columns = chunk_cells.columns = [normalize_header(c) for c in chunk.columns]
+        if not cells:
+            missing = check_missing_headers(chunk, header_map)
+            unrecognized = unexpected_headers(chunk, header_map) or []
+            col_map, messages = resolve_headers(chunk, map_name)
+            require_columns(col_map, REQUIRED_COLUMNS.get(map_name, []))
+            used = [col for col in chunk.columns if col in checked_columns(file_type, col_map)]
+
+        fixed, changes = update_all(chunk)
+        cells.append(chunk_cells[used])
+        fixes.append(fixed_cells(chunk[used], fixed[used]))
+        for category, lines in changes.items():
+            auto_changes.setdefault(category, []).extend(lines)
+
+    if not cells:
+        raise ValueError("No rows found under the header row.")
+    # Typed once over every chunk, as a column with a blank cell in one chunk would otherwise only be floats in that
+    # chunk (100001.0 there, 100001 in the rest). Then the auto-fixes' changes to each chunk go back on.
+    df = parse_cells(pd.concat(cells), file)
+    for fix in fixes:
+        for col, values in fix.items():
+            df.loc[values.index, col] = values
+    return df, col_map, auto_changes, missing, unrecognized, messages
+
+
+
+def checked_columns(file_type: str, col_map: dict) -> set:
+    """ The columns the file type's rules read: every rule's columns, and the size and colour that Clothing duplicates
+        are told apart by (which the rule doesn't need, a missing one counts as blank). """
+    keys = {key for rule in rules_for(file_type) for key in rule.columns} | {"size", "colour"}
+    return {col_map[key] for key in keys if col_map.get(key)}
+
+
+
+def fixed_cells(before: pd.DataFrame, after: pd.DataFrame) -> dict[str, pd.Series]:
+    """ The cells of each column that the auto-fixes changed, with their fixed values."""
+    changed = {}
+    for col in before.columns:
+        old, new = before[col].to_numpy(dtype=object), after[col].to_numpy(dtype=object)
+        different = ~((old == new) | (pd.isna(old) & pd.isna(new)))
+        if different.any():
+            changed[col] = after[col][different]
+    return changed
+
+
+
+@timed_stage("load")
+def load_upload(df: pd.DataFrame, file_type: str, records: bool = True) -> tuple[list | None, list[tuple[str, str]]]:
+    """ Step 2: Load the rows as objects for the checks, with any messages from resolving the headers.
+        Uploads of COLUMNAR_MIN_ROWS rows or more are checked straight from the frame instead,
+        so no objects are built for them and records is None. With records=False none are built at any size,
+        for checks that only use the frame (recheck_upload). """
+    map_name, _, load = PIPELINES[file_type]
+    if records and len(df) < COLUMNAR_MIN_ROWS:
+        return load(df)
+
+    col_map, messages = resolve_headers(df, map_name)
+    require_columns(col_map, REQUIRED_COLUMNS.get(map_name, []))
+    return None, messages
+
+
+
+@timed_stage("validate")
+def check_upload(df: pd.DataFrame, records: list | None, file_type: str, reference: Reference,
+                 workers: int = CHECK_WORKERS, col_map: dict = None) -> tuple[dict[str, list[str]], list[str]]:
+    """ Step 4: Run the registered rules for the file type. Returns the errors by the title they're displayed under,
+        and the titles of the checks skipped because their columns weren't found.
+        Checked on the objects if load_upload built them, or on the frame's columns if it didn't.
+        Independent checks run at the same time on up to workers threads.
+        col_map is the frame's header map if it's already been resolved (stream_upload's). """
+    if col_map is None:
+        col_map, _ = resolve_headers(df, PIPELINES[file_type][0])
+    results, skipped = run_rules(file_type, UploadColumns(df, col_map), reference, records, workers)
+    return {title: messages_of(result) for title, result in results.items()}, skipped
+
+
+
+@timed_stage("validate")
+def recheck_upload(df: pd.DataFrame, file_type: str, reference: Reference, revisions: dict,
+                   workers: int = CHECK_WORKERS) -> tuple[dict[str, list[str]], list[str]]:
+    """ check_upload for files that get uploaded again with a few rows fixed. revisions holds what the checks found on
+        the last upload of each file type, and only the rows that changed since then are checked again.
+        Gives the same results as check_upload, and updates revisions with this upload. """
+    col_map, _ = resolve_headers(df, PIPELINES[file_type][0])
+    columns = IncrementalColumns(df, col_map, revisions.get(file_type))
+    results, skipped = run_rules(file_type, columns, reference, workers=workers)
+    columns.settle()
+    revisions[file_type] = columns
+    return {title: messages_of(result) for title, result in results.items()}, skipped
+
+
+
+@timed_stage("export")
+def excel_bytes(df: pd.DataFrame) -> bytes:
+    """ Step 5: The fixed upload as an Excel file, for the download button.
+        Written row by row with xlsxwriter in constant memory mode if it's installed, otherwise with a write-only
+        openpyxl workbook. Both stream the rows out instead of building every cell first like df.to_excel does.
+        Constant memory mode drops cells written to a row it has already flushed, so the rows have to be written
+        in order here (df.to_excel writes a column at a time). """
+    buffer = io.BytesIO()
+    header = [str(col) for col in df.columns]
+    rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+    if xlsxwriter is not None:
+        book = xlsxwriter.Workbook(buffer, {"constant_memory": True, "strings_to_urls": False, "nan_inf_to_errors": True,
+                                            "default_date_format": "yyyy-mm-dd hh:mm:ss"})     # The date format df.to_excel uses
+        sheet = book.add_worksheet("Sheet1")
+        sheet.write_row(0, 0, header)
+        for line, row in enumerate(rows, start=1):
+            sheet.write_row(line, 0, row)
+        book.close()
+        return buffer.getvalue()
+
+    book = Workbook(write_only=True)
+    sheet = book.create_sheet("Sheet1")
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    book.save(buffer)
+    return buffer.getvalue()
+
+
+
+@timed_stage("export")
+def csv_bytes(df: pd.DataFrame) -> bytes:
+    """ Step 5: The fixed upload as a CSV file, much quicker to write than a workbook.
+        Has a byte order mark so Excel opens it as UTF-8. """
+    return df.to_csv(index=False).encode("utf-8-sig")
+
+
+
+def upload_passed(errors: dict[str, list[str]], skipped: list[str]) -> bool:
+    """ Whether an upload is ready: every check ran and none of them found anything."""
+    return not skipped and not any(errors.values())
+
+
+
+def upload_key(data: bytes, file_type: str) -> str:
+    """ Key for an upload's results: the file type and a hash of the file's contents."""
+    return f"{file_type}:{hashlib.sha1(data).hexdigest()}"
+
+
+
+def cached_step(results: dict, key: str, step: str, run, *args, depends=None):
+    """ run(*args), or what it returned last time for the same upload key and step.
+        results holds the steps of the last UPLOAD_CACHE_ENTRIES uploads, the least recently used is dropped first.
+        depends is anything else the result comes from (the reference index): it's rerun if that's a different object.
+        Errors aren't kept, so a step that failed runs again next time. """
+    steps = results.pop(key, {})
+    results[key] = steps        # Most recently used last
+    for old_key in list(results)[:-UPLOAD_CACHE_ENTRIES]:
+        del results[old_key]
+
+    if step not in steps or steps[step][0] is not depends:
+        steps[step] = (depends, run(*args))
+    return steps[step][1]
+
+
+
+# Checks ------------------
+# Each check is registered once as a Rule with its column and object versions. The titles are what the results
+# are displayed under, and the rules show up in the order they're registered here.
+
+def existing_messages(items: list, full_list, attr: str, message: str) -> list[str]:
+    """ check_duplicates as messages, one per code at the line it was last seen on (+2 to match Excel row)."""
+    return [message.format(line=idx + 2, code=code) for code, idx in check_duplicates(items, full_list, attr).items()]
+
+
+# Product
+register(Rule("Duplicate PLU Code Errors", ["Product"], columns=["plu_code"], references=["plu"],
+              check=lambda cols, ref: cols.existing("plu_code", ref.plu, PLU_EXISTS),
+              check_objects=lambda items, ref: existing_messages(items, ref.plu, "plu_code", PLU_EXISTS)))
+register(Rule("Duplicate PLUs Within Uploaded File", ["Product"], columns=["plu_code"], cost=2,
+              check=lambda cols, ref: cols.internal_duplicates("plu_code"),
+              check_objects=lambda items, ref: check_internal_duplicates(items, "plu_code")))
+register(Rule("PLU Code Length Errors", ["Product"], columns=["plu_code"],
+              check=lambda cols, ref: cols.code_length("plu_code", 15, PLU_LENGTH),
+              check_objects=lambda items, ref: check_plu_length(items)))
+register(Rule("Duplicate Barcode Within New Upload", ["Product"], columns=["plu_code", "barcode"], cost=2,
+              check=lambda cols, ref: cols.internal_barcodes("barcode", "plu_code"),
+              check_objects=lambda items, ref: duplicate_internal_barcodes(items, "plu_code") or []))
+register(Rule("Duplicate Barcodes In Database", ["Product"], columns=["barcode"], references=["barcode"],
+              check=lambda cols, ref: cols.existing("barcode", ref.barcode, BARCODE_EXISTS),
+              check_objects=lambda items, ref: existing_messages(items, ref.barcode, "barcode", BARCODE_EXISTS)))
+register(Rule("Duplicate PLU's Used As Existing Barcodes", ["Product"], columns=["plu_code"], references=["barcode"],
+              check=lambda cols, ref: cols.existing("plu_code", ref.barcode),
+              check_objects=lambda items, ref: list(check_duplicates(items, ref.barcode, "plu_code"))))
+register(Rule("Duplicate Barcodes Used As Existing PLU's", ["Product"], columns=["barcode"], references=["plu"],
+              check=lambda cols, ref: cols.existing("barcode", ref.plu),
+              check_objects=lambda items, ref: list(check_duplicates(items, ref.plu, "barcode"))))
+
+# Clothing
+register(Rule("All Duplicate Style Code Code Errors", ["Clothing"], columns=["style_code"], references=["plu"],
+              check=lambda cols, ref: cols.existing("style_code", ref.plu, STYLE_EXISTS),
+              check_objects=lambda items, ref: existing_messages(items, ref.plu, "style_code", STYLE_EXISTS)))
+register(Rule("Duplicate Style Codes Within Uploaded File", ["Clothing"], columns=["style_code"], cost=2,
+              check=lambda cols, ref: cols.clothing_duplicates("style_code", "size", "colour"),
+              check_objects=lambda items, ref: check_clothing_duplicates(items)))
+register(Rule("All Style Code Length Errors", ["Clothing"], columns=["style_code"],
+              check=lambda cols, ref: cols.code_length("style_code", 12, STYLE_LENGTH),
+              check_objects=lambda items, ref: check_style_length(items)))
+register(Rule("All Unusable Character Errors", ["Clothing"], cost=0,       # Bad characters are auto-fixed, so this always passes
+              check=lambda cols, ref: error_frame([], [], []),
+              check_objects=lambda items, ref: []))
+register(Rule("All Duplicate Barcode Errors Within New File", ["Clothing"], columns=["style_code", "barcode"], cost=2,
+              check=lambda cols, ref: cols.internal_barcodes("barcode", "style_code"),
+              check_objects=lambda items, ref: duplicate_internal_barcodes(items, "style_code") or []))
+register(Rule("Duplicate Barcodes In Database", ["Clothing"], columns=["barcode"], references=["barcode"],
+              check=lambda cols, ref: cols.existing("barcode", ref.barcode),
+              check_objects=lambda items, ref: list(check_duplicates(items, ref.barcode, "barcode"))))
+register(Rule("Duplicate Style Codes Used As Existing Barcodes", ["Clothing"], columns=["style_code"], references=["barcode"],
+              check=lambda cols, ref: cols.existing("style_code", ref.barcode),
+              check_objects=lambda items, ref: list(check_duplicates(items, ref.barcode, "style_code"))))
+register(Rule("Duplicate Barcodes Used As Existing Style Codes", ["Clothing"], columns=["barcode"], references=["plu"],
+              check=lambda cols, ref: cols.existing("barcode", ref.plu),
+              check_objects=lambda items, ref: list(check_duplicates(items, ref.plu, "barcode"))))
+
+# Product and Clothing
+register(Rule("Check If Supplier Code Exists", ["Product", "Clothing"], columns=["main_supplier"], references=["supplier"],
+              check=lambda cols, ref: cols.exist("main_supplier", ref.supplier),
+              check_objects=lambda items, ref: check_exist(items, ref.supplier, "main_supplier")))
+
+# Price Amendment
+register(Rule("Check if PLU code exists", ["Price Amendment"], columns=["plu_code"], references=["plu"],
+              check=lambda cols, ref: cols.exist("plu_code", ref.plu),
+              check_objects=lambda items, ref: check_exist(items, ref.plu, "plu_code")))
+register(Rule("Check if supplier code exists", ["Price Amendment"], columns=["main_supplier"], references=["supplier"],
+              check=lambda cols, ref: cols.exist("main_supplier", ref.supplier),
+              check_objects=lambda items, ref: check_exist(items, ref.supplier, "main_supplier")))
+
+
+
+# File type -> (header map name, auto-fixes, loader)
+PIPELINES = {
+    "Product": ("product", update_all_products, load_products),
+    "Clothing": ("clothing", update_all_clothing, load_clothing),
+    "Price Amendment": ("price_amendment", update_all_products, load_prices),
+}
+
+
+
+def validate_file(path, file_type: str, reference: Reference = None, check_workers: int = CHECK_WORKERS,
+                  stream: bool = False) -> dict:
+    """ Run the whole pipeline for one file and return a summary that can be saved as JSON.
+        reference is loaded from FULL_LIST_FILE and SUPPLIER_LIST_FILE if it isn't given.
+        Errors reading the file are raised, the same as the steps in interface.py.
+        check_workers is how many threads check_upload runs the checks on. The time each step took is in "performance".
+        With stream, the file is read with stream_upload, for files too large to read in whole. """
+    name = os.path.basename(getattr(path, "name", str(path)))
+    with PerformanceRun(name) as performance:
+        if reference is None:
+            reference, _ = load_reference(FULL_LIST_FILE, SUPPLIER_LIST_FILE)
+        if stream:
+            df, col_map, auto_changes, missing, unrecognized, messages = stream_upload(path, file_type)
+            errors, skipped = check_upload(df, None, file_type, reference, check_workers, col_map)
+        else:
+            df, auto_changes, missing, unrecognized = prepare_upload(path, file_type)
+            records, messages = load_upload(df, file_type)
+            errors, skipped = check_upload(df, records, file_type, reference, check_workers)
+
+    return {
+        "file": name,
+        "file_type": file_type,
+        "rows": len(df),
+        "passed": upload_passed(errors, skipped),
+        "missing_columns": missing,
+        "unrecognized_columns": [str(col) for col in unrecognized],
+        "messages": [{"type": type, "message": message} for message, type in messages],
+        "errors": errors,
+        "skipped_checks": skipped,
+        "auto_changes": auto_changes,
+        "performance": performance.summary(),
+    }
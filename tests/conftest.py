@@ -0,0 +1,14 @@
+"""
+Fixtures shared by the tests.
+"""
+import pytest
+
+from benchmarks.generate import write_codes_list, write_supplier_list
+
+
+@pytest.fixture
+def reference_files(tmp_path) -> tuple[str, str]:
+    """ A generated CodesList and Supplier Code List in tmp_path."""
+    write_codes_list(tmp_path / "codes.csv", 2000)
+    write_supplier_list(tmp_path / "suppliers.csv", 100)
+    return str(tmp_path / "codes.csv"), str(tmp_path / "suppliers.csv")
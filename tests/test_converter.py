@@ -0,0 +1,23 @@
+"""
+Test Converter
+
+build_records passes each column by name, so a header map in a different order from the class's arguments still
+puts every value in the right field.
+"""
+import pandas as pd
+
+from classes.product_class import Product
+from converter import build_records
+from utils.contants import PRODUCT_HEADER_MAP
+
+
+def test_build_records_by_name():
+    header_map = {"plu_code": PRODUCT_HEADER_MAP["plu_code"]} | dict(reversed(list(PRODUCT_HEADER_MAP.items())[1:]))
+    col_map = {key: key for key in header_map}
+    df = pd.DataFrame({key: [f"{key} value"] for key in header_map})
+    product, = build_records(Product, df, col_map, header_map)
+    assert product.plu_code == "plu_code value"
+    assert product.description == "description value"
+    assert product.cost == "cost_price value"
+    assert product.web == "web value"
+    assert product.excel_line == 2
@@ -0,0 +1,30 @@
+"""
+Test Export
+
+The fixed download read back in, with each of the writers excel_bytes can use.
+"""
+import io
+import pytest
+import pandas as pd
+
+import pipeline
+
+
+@pytest.fixture
+def df() -> pd.DataFrame:
+    return pd.DataFrame({"PLU": ["1001", "1002", "1003"],
+                         "Description": ["Dark Chocolate Bar", None, "www.example.com"],
+                         "Cost Price": [1.5, 2.25, float("nan")],
+                         "Launch Date": [pd.Timestamp("2025-01-02"), pd.Timestamp("2025-03-04 12:30"), pd.NaT]})
+
+
+
+@pytest.mark.parametrize("writer", ["xlsxwriter", "openpyxl"])
+def test_excel_bytes_round_trip(df, writer, monkeypatch):
+    if writer == "xlsxwriter":
+        pytest.importorskip("xlsxwriter")
+    else:
+        monkeypatch.setattr(pipeline, "xlsxwriter", None)
+
+    result = pd.read_excel(io.BytesIO(pipeline.excel_bytes(df)), dtype={"PLU": str})
+    pd.testing.assert_frame_equal(result, df, check_dtype=False)
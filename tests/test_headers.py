@@ -0,0 +1,42 @@
+"""
+Test Headers
+
+The saved header layouts: which changes make a layout resolve again, and resolving from several threads at once.
+"""
+import json
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import headers
+from utils.headers import layout_key, resolve_headers
+
+
+COLUMNS = ["plu", "descr", "costprice"]
+
+
+
+def test_layout_key_changes_with_header_map(monkeypatch):
+    key = layout_key(COLUMNS, "price_amendment")
+    monkeypatch.setitem(headers.HEADER_MAPS, "price_amendment", {**headers.HEADER_MAPS["price_amendment"], "description": ["descr"]})
+    assert layout_key(COLUMNS, "price_amendment") != key
+
+
+
+def test_layout_key_changes_with_threshold(monkeypatch):
+    key = layout_key(COLUMNS, "product")
+    monkeypatch.setattr(headers, "THRESHOLD", 0.9)
+    assert layout_key(COLUMNS, "product") != key
+
+
+
+def test_resolve_headers_across_threads(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(headers, "_resolved", {})
+    frames = [pd.DataFrame(columns=COLUMNS + [f"extra{i}"]) for i in range(32)]
+    with ThreadPoolExecutor(8) as pool:
+        col_maps = [col_map for col_map, _ in pool.map(lambda df: resolve_headers(df, "product"), frames)]
+
+    assert all(col_map["plu_code"] == "plu" for col_map in col_maps)
+    with open(headers.HEADER_LAYOUT_FILE) as file:
+        assert len(json.load(file)) == len(frames)
+    assert not [path for path in (tmp_path / ".cache").iterdir() if path.suffix == ".tmp"]
@@ -0,0 +1,43 @@
+"""
+Test Ingest
+
+read_upload picks the CSV or workbook reader by the upload's name or MIME type, not by its first bytes.
+"""
+import io
+import pytest
+
+from utils.ingest import read_upload
+
+
+HEADERS = ["plu", "description"]
+
+
+class Upload(io.BytesIO):
+    """ Stands in for a Streamlit UploadedFile, which has a name and a MIME type."""
+    def __init__(self, data: bytes, name: str, type: str):
+        super().__init__(data)
+        self.name = name
+        self.type = type
+
+
+
+def test_csv_by_name(tmp_path):
+    path = tmp_path / "upload.csv"
+    path.write_bytes(b"PLU,Description\n1001,Dark Chocolate\n")
+    df, header_row = read_upload(str(path), HEADERS)
+    assert list(df.columns) == ["PLU", "Description"] and len(df) == 1 and header_row == 0
+
+
+
+def test_csv_by_mime_type():
+    df, _ = read_upload(Upload(b"PLU,Description\n1001,Dark Chocolate\n", "upload", "text/csv"), HEADERS)
+    assert list(df.columns) == ["PLU", "Description"]
+
+
+
+@pytest.mark.parametrize("upload", [lambda path: str(path), lambda path: Upload(path.read_bytes(), path.name, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")])
+def test_workbook_that_is_not_a_zip(tmp_path, upload):
+    path = tmp_path / "upload.xlsx"
+    path.write_bytes(b"PLU,Description\n1001,Dark Chocolate\n")
+    with pytest.raises(ValueError, match="upload.xlsx is not a valid workbook"):
+        read_upload(upload(path), HEADERS)
@@ -0,0 +1,35 @@
+"""
+Test Reference Store
+
+The store's arrays and load_reference when several threads ask for a version nobody has built yet.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import reference_store
+from utils.reference_store import load_reference, open_store
+
+
+THREADS = 8
+
+
+
+def test_arrays_built_once_across_threads(tmp_path, reference_files):
+    store = open_store(tmp_path / "reference.sqlite3")
+    store.sync(*reference_files, None)
+    with ThreadPoolExecutor(THREADS) as pool:
+        results = list(pool.map(lambda _: store.arrays(), range(THREADS)))
+
+    assert len({version for version, _ in results}) == 1
+    lengths = {kind: len(codes) for kind, codes in results[0][1].items()}
+    assert all({kind: len(codes) for kind, codes in arrays.items()} == lengths for _, arrays in results)
+    assert not [name for name in os.listdir(store.array_dir) if name.endswith(".tmp")]
+
+
+
+def test_load_reference_across_threads(tmp_path, reference_files, monkeypatch):
+    monkeypatch.setattr(reference_store, "_loaded", {})
+    store_path = str(tmp_path / "reference.sqlite3")
+    with ThreadPoolExecutor(THREADS) as pool:
+        references = list(pool.map(lambda _: load_reference(*reference_files, store_path, None)[0], range(THREADS)))
+    assert all(reference is references[0] for reference in references)
@@ -0,0 +1,78 @@
+"""
+Test Validate
+
+validate_file on sheets that are missing columns: they fail instead of passing with their checks skipped.
+And stream_upload, which has to find the same errors as reading the whole sheet.
+"""
+import pytest
+import pandas as pd
+
+from benchmarks.generate import write_upload
+from pipeline import PIPELINES, check_upload, stream_upload, validate_file
+from utils import headers
+from utils.reference import ReferenceIndex
+
+
+@pytest.fixture(autouse=True)
+def header_layouts(tmp_path, monkeypatch):
+    """ Keep the header layouts resolve_headers saves in tmp_path, out of the working tree."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(headers, "_resolved", {})
+
+
+@pytest.fixture
+def reference(reference_files) -> ReferenceIndex:
+    return ReferenceIndex.from_files(*reference_files)[0]
+
+
+
+@pytest.mark.parametrize("file_type", ["Product", "Clothing", "Price Amendment"])
+def test_unrecognized_columns_raise(tmp_path, reference, file_type):
+    path = tmp_path / "foo_bar.xlsx"
+    pd.DataFrame({"Foo": [1, 2], "Bar": ["a", "b"]}).to_excel(path, index=False)
+    with pytest.raises((ValueError, KeyError)):
+        validate_file(path, file_type, reference)
+
+
+
+def test_skipped_checks_fail(tmp_path, reference):
+    path = tmp_path / "plu_only.xlsx"
+    pd.DataFrame({"PLU": ["900001", "900002"]}).to_excel(path, index=False)
+    summary = validate_file(path, "Product", reference)
+    assert summary["skipped_checks"]
+    assert not any(summary["errors"].values())
+    assert summary["passed"] is False
+
+
+
+def generated_upload(path, file_type: str):
+    write_upload(path.with_suffix(".xlsx"), file_type, 300, dirt=0.2, reference_rows=2000, seed=1)
+    if path.suffix == ".csv":
+        pd.read_excel(path.with_suffix(".xlsx"), header=None).to_csv(path, header=False, index=False)
+
+
+
+def blank_code_cell(path, file_type: str):
+    """ A blank code in the first chunk of two rows, which would make that chunk's codes floats on their own."""
+    df = pd.DataFrame({"PLU": [100001, None, 100002, 100003, "ABC", 100001], "Description": list("abcdef")})
+    df.to_csv(path, index=False) if path.suffix == ".csv" else df.to_excel(path, index=False)
+
+
+
+@pytest.mark.parametrize("extension", ["xlsx", "csv"])
+@pytest.mark.parametrize("file_type, upload, chunk_size", [(file_type, generated_upload, 97) for file_type in PIPELINES] +
+                                                          [("Product", blank_code_cell, 2)])
+def test_stream_matches_whole_sheet(tmp_path, reference, file_type, upload, chunk_size, extension):
+    path = tmp_path / f"upload.{extension}"
+    upload(path, file_type)
+    summary = validate_file(path, file_type, reference)
+
+    df, col_map, auto_changes, *_ = stream_upload(path, file_type, chunk_size=chunk_size)
+    errors, skipped = check_upload(df, None, file_type, reference, col_map=col_map)
+    assert len(df) == summary["rows"]
+    assert errors == summary["errors"] and skipped == summary["skipped_checks"]
+    # Listed a chunk at a time rather than a column at a time
+    assert {category: sorted(lines) for category, lines in auto_changes.items()} == \
+           {category: sorted(lines) for category, lines in summary["auto_changes"].items()}
+    if upload is blank_code_cell:
+        assert "Code: 100001 appears 2 times on lines [2, 7]" in errors["Duplicate PLUs Within Uploaded File"]
@@ -44,6 +44,7 @@ VAT_CODES = {23.0: 1,
 
 
 BAD_CHARS = set("'%’‘“”`,")
+BAD_CHAR_TABLE = str.maketrans("", "", "".join(BAD_CHARS))      # For str.translate, deletes every bad character
 
 
 THRESHOLD = 0.8 
@@ -103,3 +104,36 @@ PRICE_AMENDMENT_HEADER_MAP = {
     "sell_price": ["sellingprice", "sellprice", "priceforsell", "selling", "productsellingprice"],
     "stg_price": ["stgprice", "stgretailprice", "sterlingprice", "productstgprice"],
 }
+
+
+HEADER_MAPS = {
+    "product": PRODUCT_HEADER_MAP,
+    "clothing": CLOTHING_HEADER_MAP,
+    "price_amendment": PRICE_AMENDMENT_HEADER_MAP,
+}
+
+
+STREAM_CHUNK_ROWS = 5000
+CSV_SNIFF_BYTES = 64 * 1024  # Start of a CSV upload read to find its header row, encoding and delimiter
+HEADER_LAYOUT_FILE = ".cache/header_layouts.json"
+MAX_HEADER_LAYOUTS = 500
+
+
+FULL_LIST_FILE = "1_Spreadsheets/CodesList.csv"
+SUPPLIER_LIST_FILE = "1_Spreadsheets/Supplier Code List.CSV"
+REFERENCE_STORE_FILE = ".cache/reference.sqlite3"    # Reference store the exports and delta files are loaded into
+REFERENCE_DELTA_DIR = "1_Spreadsheets/deltas"         # Delta files of codes added to and removed from the reference data
+SUMMARY_DIR = "validation_summaries"
+REQUIRED_COLUMNS = {"product": ["plu_code"], "clothing": ["style_code", "description"], "price_amendment": ["plu_code"]}      # Add more keys if needed
+COLUMNAR_MIN_ROWS = 2000    # Uploads with this many rows are checked as columns instead of as objects
+CHECK_WORKERS = 4          # Threads run_rules uses to run independent checks on one upload at the same time
+UPLOAD_CACHE_ENTRIES = 5   # Uploads whose results interface.py keeps per session, so reruns don't redo the checks
+INCREMENTAL_MAX_CHANGES = 0.25    # Re-uploads with more of their rows changed than this are checked from scratch
+
+
+# Error messages, formatted with the Excel line and the code
+PLU_EXISTS = "Line: {line} \u00A0\u00A0|\u00A0\u00A0 Product {code} is already in the system."
+BARCODE_EXISTS = "Line: {line} \u00A0\u00A0|\u00A0\u00A0  Barcode {code} is already in the system."
+STYLE_EXISTS = "Line: {line} \u00A0\u00A0|\u00A0\u00A0 Item {code} is already in the system."
+PLU_LENGTH = "Line {line} \u00A0\u00A0|\u00A0\u00A0 Product: {code} has PLU Code length of {length}. Must be under 15."
+STYLE_LENGTH = "Line {line} \u00A0\u00A0|\u00A0\u00A0 Clothing item: {code} has Style Code length of {length}. Must be under 10."
@@ -0,0 +1,115 @@
+"""
+Frame Validators
+
+The checks from validators.py as column operations on the whole upload dataframe, for files where
+building an object per row is the slow part. Each check returns the errors it finds as a frame of
+(line, code, message) rows, with the same messages the object based check reports.
+"""
+import pandas as pd
+
+from utils.contants import *
+from utils.normalizer import *
+from utils.validators import lookup_set
+
+
+ERROR_COLUMNS = ["line", "code", "message"]
+
+
+
+def frame_codes(df: pd.DataFrame, col) -> pd.Series:
+    """ normalizer() for every cell of df[col], worked out once per column and shared by every check on it.
+        A missing column (col is None) is normalizer(None) on every row. """
+    if col is None:
+        return pd.Series(normalizer(None), index=df.index, dtype=object)
+    return pd.Series([str(value).strip() for value in df[col].tolist()], index=df.index, dtype=object)  # Same as normalizer() per cell
+
+
+
+def frame_column(df: pd.DataFrame, col) -> pd.Series:
+    """ df[col] as it is in the file, or all None if the column is missing (the same as getattr on the objects)."""
+    if col is None:
+        return pd.Series(None, index=df.index, dtype=object)
+    return df[col]
+
+
+
+def error_frame(lines, codes, messages) -> pd.DataFrame:
+    """ Errors as a (line, code, message) frame."""
+    return pd.DataFrame({"line": list(lines), "code": list(codes), "message": list(messages)}, columns=ERROR_COLUMNS, dtype=object)
+
+
+
+def in_reference(codes: pd.Series, full_list) -> pd.Series:
+    """ Mask of the codes that are in full_list. The reference sets are already hashed, so each code is one set lookup."""
+    full_set = lookup_set(full_list, codes)
+    return codes.map(full_set.__contains__).astype(bool)
+
+
+
+def frame_duplicates(codes: pd.Series, full_list, message: str = "{code}") -> pd.DataFrame:
+    """ check_duplicates on a column of codes: the ones that are already in full_list.
+        Each code is reported once at its last line, in the order the codes first appear, the same as check_duplicates.
+        message is formatted with the line and code. """
+    hits = codes[in_reference(codes, full_list)]
+    last_lines = dict(zip(hits, hits.index + 2))
+    return error_frame(last_lines.values(), last_lines.keys(),
+                       [message.format(line=line, code=code) for code, line in last_lines.items()])
+
+
+
+def frame_exist(codes: pd.Series, full_list) -> pd.DataFrame:
+    """ check_exist on a column of codes: every row whose code isn't in full_list."""
+    missing = codes[~in_reference(codes, full_list)]
+    lines = missing.index + 2
+    return error_frame(lines, missing, [f"Line {line} \u00A0\u00A0|\u00A0\u00A0 '{code}' does not currently exist in data base."
+                                        for line, code in zip(lines, missing)])
+
+
+
+def frame_internal_duplicates(codes: pd.Series) -> pd.DataFrame:
+    """ check_internal_duplicates on a column of codes: codes that appear more than once, reported once each at their first line."""
+    repeated = codes[codes.duplicated(keep=False)]
+    code_lines = {}
+    for code, line in zip(repeated, repeated.index + 2):
+        code_lines.setdefault(code, []).append(line)
+
+    return error_frame([lines[0] for lines in code_lines.values()], code_lines.keys(),
+                       [f"Code: {code} appears {len(lines)} times on lines {lines}" for code, lines in code_lines.items()])
+
+
+
+def frame_internal_barcodes(barcodes: pd.Series, codes: pd.Series) -> pd.DataFrame:
+    """ duplicate_internal_barcodes on a barcode column: barcodes shared by more than one row, reported once each at their first line.
+        Barcodes are compared as they are in the file, blank ones are skipped. codes are the item codes on the same rows. """
+    filled = barcodes.notna() & (barcodes != "") & (barcodes != 0)
+    shared = filled & barcodes.duplicated(keep=False)
+
+    barcode_codes = {}
+    for barcode, code, line in zip(barcodes[shared], codes[shared], barcodes.index[shared] + 2):
+        barcode_codes.setdefault(barcode, []).append((code, line))
+
+    return error_frame([rows[0][1] for rows in barcode_codes.values()], barcode_codes.keys(),
+                       [f"Barcode {barcode} is shared by: {', '.join(f'{code} (line {line})' for code, line in rows)}"
+                        for barcode, rows in barcode_codes.items()])
+
+
+
+def frame_clothing_duplicates(style_codes: pd.Series, sizes: pd.Series, colours: pd.Series) -> pd.DataFrame:
+    """ check_clothing_duplicates on the columns: every repeat of a (style code, size, colour) after its first line."""
+    keys = pd.DataFrame({"style_code": style_codes, "size": sizes, "colour": colours})
+    repeats = keys[keys.duplicated(keep="first")]
+    lines = repeats.index + 2
+    return error_frame(lines, repeats["style_code"],
+                       [f"Duplicate Style {style_code} with size {size} on line {line}"
+                        for style_code, size, line in zip(repeats["style_code"], repeats["size"], lines)])
+
+
+
+def frame_code_length(codes: pd.Series, limit: int, message: str) -> pd.DataFrame:
+    """ check_plu_length / check_style_length on a column of codes: codes longer than limit.
+        message is formatted with the line, code and length. """
+    lengths = codes.str.len()
+    too_long = lengths > limit
+    lines = codes.index[too_long] + 2
+    return error_frame(lines, codes[too_long], [message.format(line=line, code=code, length=length)
+                                                for line, code, length in zip(lines, codes[too_long], lengths[too_long])])
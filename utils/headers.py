@@ -3,16 +3,34 @@ Headers
 
 Functions for working with headers.
 """
+import os
+import json
+import hashlib
+import tempfile
+import threading
 import pandas as pd
 from utils.contants import *
 from utils.normalizer import *
+from utils.performance import timed_stage
+
+
+_found = {}         # find_header results for column layouts seen in this process
+_resolved = {}      # resolve_headers results, backed by HEADER_LAYOUT_FILE
+_lock = threading.RLock()   # Held while either is changed, the checks resolve headers from several threads
 
 
 def detect_header_row(file_path, expected_headers, max_rows=10):
     preview_df = pd.read_excel(file_path, header=None, nrows=max_rows)
+    return find_header_row(preview_df, expected_headers, max_rows)
+
 
+
+@timed_stage("header detect")
+def find_header_row(preview_df: pd.DataFrame, expected_headers, max_rows=10):
+    """ Which of the first max_rows rows of a sheet read with header=None looks most like the header row."""
     best_row = 0
     best_score = 0
+    normalized_expected = [normalize_header(header) for header in expected_headers]
 
     # print("===== SCANNING HEADER CANDIDATES =====")
     for i in range(min(max_rows, len(preview_df))):
@@ -23,12 +41,11 @@ def detect_header_row(file_path, expected_headers, max_rows=10):
         # print(f"Normalized: {normalized_row}")
 
         matches = 0
-        for header in expected_headers:
-            norm_header = normalize_header(header)
+        for norm_header in normalized_expected:
             best_header_score = max(char_match(norm_header, col) for col in normalized_row)
             if best_header_score >= THRESHOLD:
                 matches += 1
-            # print(f"→ Checking header '{header}' (normalized: '{norm_header}') → best score: {best_header_score:.2f}")
+            # print(f"→ Checking header (normalized: '{norm_header}') → best score: {best_header_score:.2f}")
 
         match_ratio = matches / len(expected_headers)
         # print(f"Match ratio for row {i}: {match_ratio:.2f}")
@@ -45,7 +62,20 @@ def detect_header_row(file_path, expected_headers, max_rows=10):
 
 def find_header(df: pd.DataFrame, possible_names: dict, used_columns: set[str]):
     """ Identify column based on a possible names reference dictionary.
-        If reference dictionary doesn't work, use char match. """
+        If reference dictionary doesn't work, use char match.
+        Results are remembered per column layout, so repeated lookups on the same frame are free. """
+    key = (tuple(df.columns), tuple(possible_names), frozenset(used_columns or ()))
+    with _lock:
+        if key not in _found:
+            if len(_found) > 4096:
+                _found.clear()
+            _found[key] = match_header(df, possible_names, used_columns)
+        return _found[key]
+
+
+
+def match_header(df: pd.DataFrame, possible_names: dict, used_columns: set[str]):
+    """ Uncached find_header."""
     normalized_cols = {normalize_header(col): col for col in df.columns}
     possible_normalized = [normalize_header(name) for name in possible_names]
 
@@ -83,6 +113,76 @@ def find_header(df: pd.DataFrame, possible_names: dict, used_columns: set[str]):
     return None, possible_names[0], "error"
 
 
+def resolve_headers(df: pd.DataFrame, map_name: str) -> tuple[dict, list[tuple[str, str]]]:
+    """ Resolve every key of HEADER_MAPS[map_name] to a column in df, each column used at most once.
+        Returns the col_map (key -> column name or None) and any (message, type) tuples from find_header.
+        Layouts are cached by their column names and saved to HEADER_LAYOUT_FILE, so a supplier's usual sheet
+        resolves straight away on later uploads. Columns are normalized before this is called, so the names
+        are the normalized headers. """
+    key = layout_key(df.columns, map_name)
+    with _lock:
+        if not _resolved:
+            _resolved.update(load_layouts())
+
+        if key not in _resolved:
+            header_map = HEADER_MAPS[map_name]
+            messages = []
+            used_columns = set()
+            col_map = {}
+            for name in header_map:
+                col, message, type = find_header(df, header_map[name], used_columns)
+                if col:
+                    used_columns.add(col)
+                col_map[name] = col  # May be None if not found
+                if message:
+                    messages.append((message, type))
+
+            _resolved[key] = {"col_map": col_map, "messages": messages}
+            for old_key in list(_resolved)[:-MAX_HEADER_LAYOUTS]:
+                del _resolved[old_key]
+            save_layouts(_resolved)
+
+        layout = _resolved[key]
+    return dict(layout["col_map"]), [tuple(message) for message in layout["messages"]]
+
+
+
+def layout_key(columns, map_name: str) -> str:
+    """ Key for a sheet layout: the header map name and a hash of the column names in order, the header map itself
+        and THRESHOLD, so layouts saved before either was changed aren't used. """
+    names = "\t".join(str(col) for col in columns)
+    layout = f"{THRESHOLD}\n{json.dumps(HEADER_MAPS[map_name])}\n{names}"
+    return f"{map_name}:{hashlib.sha1(layout.encode()).hexdigest()}"
+
+
+
+def load_layouts(path: str = HEADER_LAYOUT_FILE) -> dict:
+    """ Layouts saved by save_layouts, or nothing if there aren't any yet."""
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+
+def save_layouts(layouts: dict, path: str = HEADER_LAYOUT_FILE):
+    """ Save the layouts as JSON, through a temporary file of its own so processes saving at once don't clash."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+        try:
+            with os.fdopen(handle, "w") as file:
+                json.dump(layouts, file)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except OSError as e:
+        print(f"Could not save header layouts to {path}: {e}")
+
+
+
 def check_missing_headers(df: pd.DataFrame, header_map: dict[str, list[str]]) -> list[str]:
     """
     Checks for missing expected headers in a DataFrame using a HEADER_MAP.
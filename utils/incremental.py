@@ -0,0 +1,251 @@
+"""
+Incremental
+
+Checking a re-upload from what was found on the last upload of the same type. Suppliers usually fix a few rows
+and upload the file again, so IncrementalColumns keeps what each check needs per row (normalized codes, whether
+each code is in the reference, how long it is) and, for the checks across rows, which rows share each value.
+On the next upload each column is hashed row by row, and only the rows whose values changed are worked out again.
+Rows are matched by position, so inserting or deleting rows near the top changes everything below them, and
+uploads with more than INCREMENTAL_MAX_CHANGES of their rows changed are checked from scratch.
+"""
+import bisect
+from functools import partial
+import numpy as np
+import pandas as pd
+
+from utils.contants import *
+from utils.frame_validators import *
+from utils.validators import lookup_set
+from utils.rules import UploadColumns
+
+
+
+def is_missing(value) -> bool:
+    return value is None or value is pd.NA or (isinstance(value, float) and value != value)
+
+
+
+def is_filled(value) -> bool:
+    """ Whether a barcode cell has a barcode in it, the same test frame_internal_barcodes uses."""
+    return not is_missing(value) and value != "" and value != 0
+
+
+
+class Groups:
+    """ The positions of the rows sharing each value, and which values more than one row has.
+        values holds every row's value, rows where include(value) is False aren't grouped. """
+    __slots__ = ("values", "include", "positions", "repeated")
+
+    def __init__(self, values: list, include=None):
+        self.values = values
+        self.include = include
+        self.positions = {}
+        for position, value in enumerate(values):
+            if include is None or include(value):
+                self.positions.setdefault(value, []).append(position)
+        self.repeated = {value for value, positions in self.positions.items() if len(positions) > 1}
+
+
+    def _remove(self, position: int, value):
+        positions = self.positions[value]
+        positions.remove(position)
+        if not positions:
+            del self.positions[value]
+        if len(positions) < 2:
+            self.repeated.discard(value)
+
+
+    def _add(self, position: int, value):
+        positions = self.positions.setdefault(value, [])
+        bisect.insort(positions, position)
+        if len(positions) > 1:
+            self.repeated.add(value)
+
+
+    def revise(self, values: list, changed: np.ndarray) -> "Groups":
+        """ These groups updated in place for the new values, where only the rows at changed have different values.
+            Rows past the end of values have been removed. """
+        old_values = self.values
+        for position in changed.tolist():
+            if position < len(old_values) and (self.include is None or self.include(old_values[position])):
+                self._remove(position, old_values[position])
+            if position < len(values) and (self.include is None or self.include(values[position])):
+                self._add(position, values[position])
+        self.values = values
+        return self
+
+
+    def first_positions(self) -> list:
+        """ The repeated values, in the order they first appear."""
+        return sorted(self.repeated, key=lambda value: self.positions[value][0])
+
+
+
+class IncrementalColumns(UploadColumns):
+    """ UploadColumns that keeps the per-row results of the checks, so the next upload of the same type can be
+        checked by working out only the rows that changed. Pass the last upload's IncrementalColumns as previous.
+        The checks give the same error frames as the frame_validators functions. """
+    __slots__ = ("_hashes", "_verdicts", "_groups", "_previous", "_changed")
+
+    def __init__(self, df: pd.DataFrame, col_map: dict, previous: "IncrementalColumns" = None):
+        super().__init__(df, col_map)
+        self._hashes = {}       # key -> hash of each row's value in the column
+        self._verdicts = {}     # (check, key, id of what it was worked out against) -> (that, bool per row)
+        self._groups = {}       # (check, keys) -> Groups
+        self._previous = previous
+        self._changed = {}      # keys -> positions that changed since previous, or None to work everything out
+
+
+    def hashes(self, key: str) -> np.ndarray:
+        """ A hash of each row's value in the column. Text columns are hashed by their text, so the type of each
+            cell goes in too (1 and "1" are different barcodes). """
+        def compute():
+            raw = self.raw(key)
+            hashes = pd.util.hash_pandas_object(raw, index=False).to_numpy()
+            if raw.dtype == object:
+                hashes = hashes ^ pd.util.hash_pandas_object(raw.map(lambda value: type(value).__name__), index=False).to_numpy()
+            return hashes
+        return self._cached(self._hashes, key, compute)
+
+
+    def changed(self, *keys: str) -> np.ndarray | None:
+        """ Positions whose value in any of the columns is different from the last upload, including rows that were
+            added or removed. None if there's no last upload or too much changed for patching to be worth it. """
+        def compute():
+            previous = self._previous
+            if previous is None:
+                return None
+            common = min(len(previous.df), len(self.df))
+            different = np.zeros(common, dtype=bool)
+            for key in keys:
+                different |= self.hashes(key)[:common] != previous.hashes(key)[:common]
+            changed = np.concatenate([np.flatnonzero(different), np.arange(common, max(len(previous.df), len(self.df)))])
+            too_many = len(changed) > INCREMENTAL_MAX_CHANGES * max(len(self.df), 1)
+            return None if too_many else changed
+        return self._cached(self._changed, keys, compute)
+
+
+    def settle(self):
+        """ Let go of the last upload once the checks have run, so uploads don't hold on to every one before them."""
+        with self._lock:
+            self._previous = None
+            self._changed.clear()
+
+
+    def codes(self, key: str) -> pd.Series:
+        """ frame_codes for the column, reusing the last upload's codes for the rows that didn't change."""
+        def compute():
+            changed = self.changed(key)
+            if changed is None or key not in self._previous._codes:
+                return frame_codes(self.df, self.col_map.get(key))
+            values = resized(self._previous._codes[key].to_numpy(dtype=object), len(self.df), "")
+            changed = changed[changed < len(self.df)]
+            raw = self.raw(key)
+            values[changed] = [str(value).strip() for value in raw.iloc[changed].tolist()]  # Same as normalizer()
+            return pd.Series(values, index=self.df.index, dtype=object)
+        return self._cached(self._codes, key, compute)
+
+
+    def verdicts(self, check: str, key: str, against, test) -> np.ndarray:
+        """ A bool per row from test(codes), which gives one for each of a list of codes (so a reference can look
+            them up all at once). against is what the result depends on besides the code (a reference, a length limit):
+            the last upload's results are only reused for the same object. """
+        def compute():
+            codes = self.codes(key)
+            changed = self.changed(key)
+            previous = self._previous._verdicts.get(name) if changed is not None else None
+            if previous is None or previous[0] is not against:
+                return against, np.fromiter(test(codes.tolist()), dtype=bool, count=len(codes))
+            verdicts = resized(previous[1], len(codes), False)
+            changed = changed[changed < len(codes)]
+            verdicts[changed] = list(test(codes.iloc[changed].tolist()))
+            return against, verdicts
+        name = (check, key, id(against))
+        return self._cached(self._verdicts, name, compute)[1]
+
+
+    def groups(self, check: str, keys: tuple, values, include=None) -> Groups:
+        """ Groups of the rows by values() (a list with a value per row), updated from the last upload's groups
+            for the rows that changed in any of the columns in keys. """
+        def compute():
+            changed = self.changed(*keys)
+            previous = self._previous._groups.get((check, keys)) if changed is not None else None
+            if previous is None:
+                return Groups(values(), include)
+            # Taken over rather than copied, the last upload's results aren't needed again
+            del self._previous._groups[(check, keys)]
+            return previous.revise(values(), changed)
+        return self._cached(self._groups, (check, keys), compute)
+
+
+    def lines(self) -> list[int]:
+        """ Excel line of each row (+2 for the header row and 0-indexing)."""
+        return (self.df.index + 2).tolist()
+
+
+    # Checks ------------------
+
+    def code_length(self, key: str, limit: int, message: str) -> pd.DataFrame:
+        too_long = np.flatnonzero(self.verdicts("length", key, limit, lambda codes: [len(code) > limit for code in codes]))
+        codes, lines = self.codes(key).to_numpy(dtype=object), self.lines()
+        return error_frame([lines[p] for p in too_long], codes[too_long],
+                           [message.format(line=lines[p], code=codes[p], length=len(codes[p])) for p in too_long])
+
+
+    def exist(self, key: str, full_list) -> pd.DataFrame:
+        missing = np.flatnonzero(~self.verdicts("reference", key, full_list, partial(in_full_list, full_list)))
+        codes, lines = self.codes(key).to_numpy(dtype=object), self.lines()
+        return error_frame([lines[p] for p in missing], codes[missing],
+                           [f"Line {lines[p]} \u00A0\u00A0|\u00A0\u00A0 '{codes[p]}' does not currently exist in data base." for p in missing])
+
+
+    def existing(self, key: str, full_list, message: str = "{code}") -> pd.DataFrame:
+        hits = np.flatnonzero(self.verdicts("reference", key, full_list, partial(in_full_list, full_list)))
+        codes, lines = self.codes(key).to_numpy(dtype=object), self.lines()
+        last_lines = {codes[p]: lines[p] for p in hits}
+        return error_frame(last_lines.values(), last_lines.keys(),
+                           [message.format(line=line, code=code) for code, line in last_lines.items()])
+
+
+    def internal_duplicates(self, key: str) -> pd.DataFrame:
+        groups = self.groups("internal", (key,), lambda: self.codes(key).tolist())
+        lines = self.lines()
+        code_lines = {code: [lines[p] for p in groups.positions[code]] for code in groups.first_positions()}
+        return error_frame([lines[0] for lines in code_lines.values()], code_lines.keys(),
+                           [f"Code: {code} appears {len(lines)} times on lines {lines}" for code, lines in code_lines.items()])
+
+
+    def internal_barcodes(self, key: str, code_key: str) -> pd.DataFrame:
+        groups = self.groups("barcodes", (key,), lambda: self.raw(key).tolist(), is_filled)
+        codes, lines = self.codes(code_key).to_numpy(dtype=object), self.lines()
+        barcode_rows = {barcode: [(codes[p], lines[p]) for p in groups.positions[barcode]] for barcode in groups.first_positions()}
+        return error_frame([rows[0][1] for rows in barcode_rows.values()], barcode_rows.keys(),
+                           [f"Barcode {barcode} is shared by: {', '.join(f'{code} (line {line})' for code, line in rows)}"
+                            for barcode, rows in barcode_rows.items()])
+
+
+    def clothing_duplicates(self, key: str, size_key: str, colour_key: str) -> pd.DataFrame:
+        def values():
+            # Missing sizes and colours all count as the same, the same as DataFrame.duplicated
+            return [(code, None if is_missing(size) else size, None if is_missing(colour) else colour)
+                    for code, size, colour in zip(self.codes(key).tolist(), self.raw(size_key).tolist(), self.raw(colour_key).tolist())]
+        groups = self.groups("clothing", (key, size_key, colour_key), values)
+        repeats = sorted(p for value in groups.repeated for p in groups.positions[value][1:])
+        codes, sizes, lines = self.codes(key).to_numpy(dtype=object), self.raw(size_key).tolist(), self.lines()
+        return error_frame([lines[p] for p in repeats], codes[repeats],
+                           [f"Duplicate Style {codes[p]} with size {sizes[p]} on line {lines[p]}" for p in repeats])
+
+
+
+def in_full_list(full_list, codes: list) -> list[bool]:
+    """ Whether each of codes is in full_list, looked up all at once."""
+    full_set = lookup_set(full_list, codes)
+    return [code in full_set for code in codes]
+
+
+
+def resized(values: np.ndarray, length: int, fill) -> np.ndarray:
+    """ A copy of values cut or padded with fill to length."""
+    if len(values) >= length:
+        return values[:length].copy()
+    return np.concatenate([values, np.full(length - len(values), fill, dtype=values.dtype)])
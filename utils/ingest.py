@@ -0,0 +1,238 @@
+"""
+Ingest
+
+Functions for reading uploaded files into dataframes.
+"""
+import io
+import os
+import csv
+import pandas as pd
+from collections import Counter
+from itertools import chain, islice
+from openpyxl import load_workbook
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from pandas.errors import EmptyDataError
+from pandas.io.parsers import TextParser
+
+from utils.headers import *
+from utils.performance import timed_stage
+
+
+
+@timed_stage("ingest")
+def read_upload(file, expected_headers, max_rows=10) -> tuple[pd.DataFrame, int]:
+    """ Read an uploaded workbook with a single pass over the xlsx.
+        The cells are read once, the header row is detected from the first max_rows rows in memory,
+        and the rows under it are parsed into the same frame as pd.read_excel(file, header=header_row).
+        CSV files are read with read_csv_upload instead. Returns the frame and the header row. """
+    if is_csv(file):
+        return read_csv_upload(file, expected_headers, max_rows)
+
+    require_workbook(file)
+    rows = read_sheet_rows(file)
+    header_row = find_header_row(parse_rows(rows[:max_rows], header=None), expected_headers, max_rows)
+    return parse_rows(rows, header=header_row), header_row
+
+
+
+def iter_upload(file, expected_headers, chunk_size=STREAM_CHUNK_ROWS, max_rows=10, raw=False):
+    """ Streaming version of read_upload for very large workbooks.
+        Rows are read with openpyxl in read-only mode and parsed chunk_size rows at a time, so only one chunk
+        is in memory at once. Each chunk's index carries on from the last one, so Excel line numbers still line up.
+        Each chunk's column types are worked out from that chunk alone. With raw, (chunk, cells) pairs are yielded,
+        cells being the same rows as read, before any types are worked out, for parse_cells to type all at once. """
+    if is_csv(file):
+        data = file_bytes(file)
+        header_row, encoding, delimiter = sniff_csv(data, expected_headers, max_rows)
+        def chunks(**kwargs):
+            return pd.read_csv(io.BytesIO(data), encoding=encoding, encoding_errors="replace", sep=delimiter,
+                               header=header_row, skip_blank_lines=False, engine="c", chunksize=chunk_size, **kwargs)
+        yield from zip(chunks(), chunks(dtype=object)) if raw else chunks()
+        return
+
+    require_workbook(file)
+    rows = iter_sheet_rows(file)
+    preview = list(islice(rows, max_rows))
+    header_row = find_header_row(parse_rows(pad_rows(preview), header=None), expected_headers, max_rows)
+    if header_row >= len(preview):
+        return
+
+    header = preview[header_row]
+    body = chain(preview[header_row + 1:], rows)
+    start = 0
+    while chunk := list(islice(body, chunk_size)):
+        chunk = pad_rows([header] + chunk)
+        df = parse_rows(chunk, header=0)
+        df.index = pd.RangeIndex(start, start + len(df))
+        start += len(df)
+        yield (df, pd.DataFrame(chunk[1:], columns=df.columns, index=df.index, dtype=object)) if raw else df
+
+
+
+def parse_cells(cells: pd.DataFrame, file) -> pd.DataFrame:
+    """ Columns of cells from iter_upload(raw=True), joined from any number of chunks, typed the way read_upload
+        types a whole sheet: each column's type is worked out from all of its cells together. """
+    if is_csv(file):
+        df = pd.read_csv(io.StringIO(cells.to_csv(index=False)), skip_blank_lines=False, engine="c")
+    else:
+        df = parse_rows([list(cells.columns)] + cells.to_numpy().tolist(), header=0)
+    df.columns = cells.columns
+    df.index = cells.index
+    return df
+
+
+
+def is_csv(file) -> bool:
+    """ Whether the upload is a CSV file, going by its name or the MIME type it was uploaded with.
+        Anything else is read as a workbook. """
+    return upload_name(file).lower().endswith(".csv") or "csv" in (getattr(file, "type", None) or "")
+
+
+
+def require_workbook(file):
+    """ Raise a ValueError if the upload isn't an xlsx workbook, rather than letting openpyxl fail on it."""
+    if not is_workbook(file):
+        raise ValueError(f"{os.path.basename(upload_name(file)) or 'The upload'} is not a valid workbook. Save it as .xlsx or .csv and upload it again.")
+
+
+
+def upload_name(file) -> str:
+    """ File name of a path or an uploaded file, "" for a buffer without one."""
+    if isinstance(file, (str, os.PathLike)):
+        return os.fspath(file)
+    return str(getattr(file, "name", ""))
+
+
+
+def is_workbook(file) -> bool:
+    """ Whether the upload starts like an xlsx workbook (a zip archive)."""
+    if hasattr(file, "read"):
+        position = file.tell()
+        start = file.read(4)
+        file.seek(position)
+    else:
+        with open(file, "rb") as f:
+            start = f.read(4)
+    return start == b"PK\x03\x04"
+
+
+
+def file_bytes(file) -> bytes:
+    """ The whole upload, from a path or an uploaded file."""
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    if hasattr(file, "read"):
+        position = file.tell()
+        data = file.read()
+        file.seek(position)
+        return data
+    with open(file, "rb") as f:
+        return f.read()
+
+
+
+def sniff_csv(data: bytes, expected_headers, max_rows=10) -> tuple[int, str, str]:
+    """ Work out the header row, encoding and delimiter of a CSV file from its first max_rows lines.
+        Files that aren't UTF-8 are taken to be Windows-1252, which is what Excel saves CSV as. """
+    try:
+        data.decode("utf-8-sig")
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError:
+        encoding = "cp1252"
+
+    lines = data[:CSV_SNIFF_BYTES].decode(encoding, errors="ignore").splitlines()[:max_rows]
+    delimiter = sniff_delimiter(lines)
+    rows = [[cell.strip() for cell in row] for row in csv.reader(lines, delimiter=delimiter)]
+    header_row = find_header_row(parse_rows(pad_rows(rows), header=None), expected_headers, max_rows)
+    return header_row, encoding, delimiter
+
+
+
+def sniff_delimiter(lines: list[str], delimiters=",;\t|") -> str:
+    """ The delimiter that splits the most lines into the same number of cells, comma if none of them split anything.
+        Title rows above the header don't split, so they don't count against the right one. """
+    best, best_score = ",", (0, 0)
+    for delimiter in delimiters:
+        widths = Counter(len(row) for row in csv.reader(lines, delimiter=delimiter) if len(row) > 1)
+        if widths:
+            width, count = widths.most_common(1)[0]
+            if (count, width) > best_score:
+                best, best_score = delimiter, (count, width)
+    return best
+
+
+
+def read_csv_upload(file, expected_headers, max_rows=10) -> tuple[pd.DataFrame, int]:
+    """ read_upload for CSV files. The header row is found in the first max_rows lines, then the file is read with
+        pandas' C parser, which types the columns the same way as the xlsx path. Returns the frame and the header row. """
+    data = file_bytes(file)
+    header_row, encoding, delimiter = sniff_csv(data, expected_headers, max_rows)
+    try:
+        df = pd.read_csv(io.BytesIO(data), encoding=encoding, encoding_errors="replace", sep=delimiter,
+                         header=header_row, skip_blank_lines=False, engine="c")
+    except EmptyDataError:
+        df = pd.DataFrame()
+    return df, header_row
+
+
+
+def read_sheet_rows(file) -> list[list]:
+    """ Cell values of the first sheet as lists of the same width."""
+    return pad_rows(list(iter_sheet_rows(file)))
+
+
+
+def iter_sheet_rows(file):
+    """ Stream the cell values of the first sheet row by row, converted the same way pandas' openpyxl reader does.
+        Trailing empty cells are trimmed, and empty rows are only yielded once a row with data follows them. """
+    book = load_workbook(file, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = book.worksheets[0]
+        sheet.reset_dimensions()
+
+        blank_rows = 0
+        for row in sheet.iter_rows():
+            values = [convert_cell(cell) for cell in row]
+            while values and values[-1] == "":      # Trim trailing empty cells
+                values.pop()
+            if not values:
+                blank_rows += 1
+                continue
+            yield from ([] for _ in range(blank_rows))
+            blank_rows = 0
+            yield values
+    finally:
+        book.close()
+
+
+
+def pad_rows(rows: list[list]) -> list[list]:
+    """ Pad every row with empty cells to the width of the widest one."""
+    if not rows:
+        return rows
+    width = max(len(row) for row in rows)
+    return [row + [""] * (width - len(row)) for row in rows]
+
+
+
+def convert_cell(cell):
+    """ Empty cells become "", error cells NaN and whole floats int. """
+    if cell.value is None:
+        return ""
+    elif cell.data_type == TYPE_ERROR:
+        return float("nan")
+    elif cell.data_type == TYPE_NUMERIC:
+        value = int(cell.value)
+        if value == cell.value:
+            return value
+        return float(cell.value)
+    return cell.value
+
+
+
+def parse_rows(rows: list[list], header) -> pd.DataFrame:
+    """ Parse raw sheet rows into a typed dataframe with the same parser pd.read_excel uses."""
+    try:
+        return TextParser(rows, header=header, skip_blank_lines=False).read()
+    except EmptyDataError:
+        return pd.DataFrame()
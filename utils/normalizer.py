@@ -3,6 +3,9 @@ Normalizer
 
 Functions used for normalizing everything for the program. Mostly for fixing headers.
 """
+from collections import Counter
+
+from utils.contants import HEADER_MAPS
 
 
 def normalizer(value):
@@ -40,21 +43,35 @@ def char_match(target: str, possible: str):
     """
     target = normalize_header(target)
     possible = normalize_header(possible)
-    target_list = list(target)
-    possible_list = list(possible)
-    unmatched_list = []
-
-    for char in possible_list:
-        if char in target_list:
-            target_list.remove(char)
-        else:
-            unmatched_list.append(char)
-        
+    target_counts = char_histogram(target)
+    possible_counts = char_histogram(possible)
+
+    # Characters of possible that can be paired with one in target, counting repeats
+    matched = sum(min(count, target_counts.get(char, 0)) for char, count in possible_counts.items())
+
     total_possible = len(target) + len(possible)
-    total = len(unmatched_list) + len(target_list)
+    total = (len(possible) - matched) + (len(target) - matched)
     score = 1 - (total / total_possible)
     return score
 
 
 
+def char_histogram(header: str) -> Counter:
+    """ Character counts of a normalized header. Every header map alias is counted once at import,
+        anything else is counted the first time it's seen. """
+    counts = _histograms.get(header)
+    if counts is None:
+        counts = Counter(header)
+        if len(_histograms) < 10000:
+            _histograms[header] = counts
+    return counts
+
+
+
+_histograms = {}
+_histograms.update((normalize_header(alias), Counter(normalize_header(alias)))
+                   for header_map in HEADER_MAPS.values() for aliases in header_map.values() for alias in aliases)
+
+
+
 
@@ -0,0 +1,188 @@
+"""
+Performance
+
+Wall time, rows and peak memory for each stage of a validation run, so a slow upload can be traced to the
+step that's slow without a profiler. The stage functions are wrapped with timed_stage, and every stage that
+finishes while a PerformanceRun is active is added to it and logged as a JSON line on the
+"validation.performance" logger. Memory is only measured when the run asks for it (tracemalloc slows the
+stages down while it's on).
+"""
+import json
+import time
+import logging
+import functools
+import tracemalloc
+import pandas as pd
+from contextvars import ContextVar
+
+
+logger = logging.getLogger("validation.performance")
+_current = ContextVar("performance_run", default=None)     # PerformanceRun the stages are being added to
+
+
+
+class StageTiming:
+    """ One finished stage. Stages can be nested (ingest includes header detect), depth is how far in it was."""
+    __slots__ = ("name", "seconds", "rows", "peak_mb", "depth")
+
+    def __init__(self, name: str, seconds: float, rows: int | None, peak_mb: float | None, depth: int):
+        self.name = name
+        self.seconds = seconds
+        self.rows = rows
+        self.peak_mb = peak_mb
+        self.depth = depth
+
+
+    def as_dict(self) -> dict:
+        return {"stage": self.name, "seconds": round(self.seconds, 4), "rows": self.rows,
+                "peak_mb": None if self.peak_mb is None else round(self.peak_mb, 2), "depth": self.depth}
+
+
+
+class PerformanceRun:
+    """ Collects the stages of one upload, in the order they finish.
+        Use it as a context manager, or call start() and stop() where a with block doesn't fit.
+        memory=True measures each stage's peak memory with tracemalloc. """
+
+    def __init__(self, label: str = "", memory: bool = False):
+        self.label = label
+        self.memory = memory
+        self.stages = []
+        self._token = None
+        self._started_tracing = False
+        self._depth = 0         # Stages that have started and not finished yet
+        self._peaks = []        # Peak memory so far of each of them, outermost first, when measuring memory
+
+
+    def start(self):
+        """ Start adding stages to this run. A run left going in the same context (a script stopped part way) is stopped first."""
+        previous = _current.get()
+        if previous is not None:
+            previous.stop()
+        self._token = _current.set(self)
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+
+    def stop(self):
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:      # Started in a different context
+                _current.set(None)
+            self._token = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return self
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+    def total(self) -> float:
+        """ Time of the outermost stages, so nested stages aren't counted twice."""
+        return sum(stage.seconds for stage in self.stages if stage.depth == 0)
+
+
+    def summary(self) -> list[dict]:
+        return [stage.as_dict() for stage in self.stages]
+
+
+    def as_frame(self) -> pd.DataFrame:
+        """ The stages as a table for display, nested ones indented under the stage they ran in."""
+        return pd.DataFrame([{"Stage": "\u00A0" * 4 * stage.depth + stage.name, "Seconds": round(stage.seconds, 3),
+                              "Rows": stage.rows, "Peak MB": None if stage.peak_mb is None else round(stage.peak_mb, 1)}
+                             for stage in self.stages], columns=["Stage", "Seconds", "Rows", "Peak MB"]).astype({"Rows": "Int64"})
+
+
+
+def count_rows(value) -> int | None:
+    """ Rows in a frame, list or the first item of a tuple (the (df, ...) results of the stage functions)."""
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    if isinstance(value, (pd.DataFrame, list)):
+        return len(value)
+    return None
+
+
+
+class timed_stage:
+    """ Time a stage of the pipeline, as a decorator or a with block:
+
+            @timed_stage("load")
+            def load_products(df): ...
+
+            with timed_stage("export", rows=len(df)):
+                df.to_excel(buffer)
+
+        As a decorator the rows are taken from the first frame argument, or from the result.
+        Outside a PerformanceRun the stage is only logged. """
+
+    def __init__(self, name: str, rows: int | None = None):
+        self.name = name
+        self.rows = rows
+        self._run = None
+        self._start = 0.0
+
+
+    def __enter__(self):
+        run = self._run = _current.get()
+        if run is not None:
+            run._depth += 1
+            if run.memory and tracemalloc.is_tracing():
+                # reset_peak loses the peak of the stages this one is inside, so hand it to them first
+                peak = tracemalloc.get_traced_memory()[1]
+                run._peaks = [max(open_peak, peak) for open_peak in run._peaks] + [0]
+                tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self._start
+        run = self._run
+        peak_mb = None
+        if run is not None:
+            run._depth -= 1
+            if run._peaks and tracemalloc.is_tracing():
+                peak = max(run._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                run._peaks = [max(open_peak, peak) for open_peak in run._peaks]
+                peak_mb = peak / 2 ** 20
+
+        timing = StageTiming(self.name, seconds, self.rows, peak_mb, run._depth if run is not None else 0)
+        if run is not None:
+            run.stages.append(timing)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({"run": run.label if run is not None else None, **timing.as_dict(),
+                                    "failed": exc[0] is not None}))
+        self._run = None
+
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rows = next((len(arg) for arg in args if isinstance(arg, pd.DataFrame)), None)
+            with timed_stage(self.name, rows) as stage:
+                result = func(*args, **kwargs)
+                if stage.rows is None:
+                    stage.rows = count_rows(result)
+                return result
+        return wrapper
+
+
+
+def log_stages(level: int = logging.INFO):
+    """ Print the stage log lines to stderr, for when nothing else has set up logging. Only adds a handler once."""
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(level)
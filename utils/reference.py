@@ -0,0 +1,95 @@
+"""
+Reference
+
+Lookup index for the reference data (CodesList and Supplier Code List) that uploads get checked against.
+"""
+import pandas as pd
+from typing import Protocol
+
+from utils.contants import *
+from utils.headers import *
+from utils.normalizer import *
+from utils.reference_arrays import ArrayCodes
+
+
+
+class Reference(Protocol):
+    """ What the checks need from the reference data: a ReferenceIndex, or the ArrayReference load_reference gives.
+        plu, barcode and supplier are the normalized codes, as anything lookup_set takes. """
+    plu: frozenset[str] | ArrayCodes
+    barcode: frozenset[str] | ArrayCodes
+    supplier: frozenset[str] | ArrayCodes
+
+    def row_of(self, code, kind: str = "plu") -> int | None: ...
+
+
+
+class ReferenceIndex:
+    """ Normalized PLU, barcode and supplier codes held as frozensets so every membership check is O(1).
+        plu_rows / barcode_rows map each code back to its line in the CodesList file. """
+
+    def __init__(self, plu_rows: dict[str, int], barcode_rows: dict[str, int], supplier_codes):
+        self.plu_rows = plu_rows
+        self.barcode_rows = barcode_rows
+        self.plu = frozenset(plu_rows)
+        self.barcode = frozenset(barcode_rows)
+        self.supplier = frozenset(normalizer(code) for code in supplier_codes)
+
+
+    def __repr__(self):
+        return f"ReferenceIndex: {len(self.plu)} PLUs | {len(self.barcode)} barcodes | {len(self.supplier)} suppliers"
+
+
+    def __reduce__(self):
+        # Only pickle the row maps, the frozensets are cheaper to rebuild than to unpickle
+        return self.__class__, (self.plu_rows, self.barcode_rows, self.supplier)
+
+
+    def row_of(self, code, kind: str = "plu"):
+        """ Line in the CodesList file where the code appears, or None if it isn't there."""
+        rows = self.plu_rows if kind == "plu" else self.barcode_rows
+        return rows.get(normalizer(code))
+
+
+    @classmethod
+    def from_frames(cls, full_list_df: pd.DataFrame, supplier_df: pd.DataFrame):
+        """ Build the index from the CodesList and Supplier Code List dataframes.
+            Returns the index and any header messages as (message, type) tuples. """
+        plu_rows, barcode_rows, messages = codes_list_rows(full_list_df)
+        return cls(plu_rows, barcode_rows, supplier_list_codes(supplier_df)), messages
+
+
+    @classmethod
+    def from_files(cls, full_list_file: str, supplier_file: str):
+        """ Read both reference CSVs and build the index."""
+        return cls.from_frames(pd.read_csv(full_list_file), pd.read_csv(supplier_file))
+
+
+
+def codes_list_rows(full_list_df: pd.DataFrame) -> tuple[dict[str, int], dict[str, int], list[tuple[str, str]]]:
+    """ The PLU and barcode code_rows of the CodesList, and any header messages as (message, type) tuples."""
+    full_list_df = full_list_df.copy()
+    full_list_df.columns = [normalize_header(c) for c in full_list_df.columns]
+
+    messages = []
+    rows = {}
+    for key in ["barcode", "plu_code"]:
+        col, message, type = find_header(full_list_df, PRODUCT_HEADER_MAP[key], used_columns=None)
+        if message:
+            messages.append((message, type))
+        rows[key] = code_rows(full_list_df[col]) if col is not None else {}
+    return rows["plu_code"], rows["barcode"], messages
+
+
+
+def supplier_list_codes(supplier_df: pd.DataFrame) -> list:
+    """ The supplier codes in the first column of the Supplier Code List."""
+    return supplier_df.iloc[:, 0].dropna().tolist()
+
+
+
+def code_rows(column: pd.Series) -> dict[str, int]:
+    """ Map each normalized code in the column to its first Excel/CSV line (header is line 1)."""
+    codes = column.dropna().map(normalizer)
+    codes = codes[~codes.duplicated()]
+    return dict(zip(codes.tolist(), (codes.index + 2).tolist()))
@@ -0,0 +1,102 @@
+"""
+Reference Arrays
+
+Reference codes as sorted arrays in .npy files that get memory-mapped instead of read in. Barcodes and PLUs are
+nearly all numbers, so those are kept as uint64s (8 bytes a code, rather than a Python str each), and the few
+codes that aren't numbers go in a sorted text array beside them. Codes are looked up a batch at a time by binary
+search, which only touches the pages it lands on, and every process that maps the same file shares one copy of it
+in the OS page cache.
+"""
+import os
+import tempfile
+import numpy as np
+from itertools import chain, compress
+
+
+
+def is_number(code: str) -> bool:
+    """ Whether a code is kept as a number: ASCII digits only, with no leading zero to lose and fewer than 20 of them
+        (so it fits in a uint64). "00123" and "5012345678900.0" stay text. """
+    return code.isascii() and code.isdigit() and (code[0] != "0" or code == "0") and len(code) < 20
+
+
+
+def in_sorted(array: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """ Mask of the values that are in the sorted array."""
+    positions = np.searchsorted(array, values)
+    found = positions < len(array)
+    found[found] = array[positions[found]] == values[found]
+    return found
+
+
+
+class ArrayCodes:
+    """ One kind of reference code as a sorted uint64 array of the numeric codes and a sorted text array of the rest.
+        lookup_set asks it which of an upload's codes it has, all at once. """
+    __slots__ = ("numbers", "text")
+
+    def __init__(self, numbers: np.ndarray, text: np.ndarray):
+        self.numbers = numbers
+        self.text = text
+
+
+    def __repr__(self):
+        return f"ArrayCodes: {len(self.numbers)} numbers | {len(self.text)} text"
+
+
+    def __len__(self):
+        return len(self.numbers) + len(self.text)
+
+
+    @classmethod
+    def from_codes(cls, codes) -> "ArrayCodes":
+        """ Sort normalized codes into the two arrays."""
+        numbers, text = split_codes(set(codes))
+        return cls(np.sort(as_numbers(numbers)), np.sort(np.array(text, dtype=str)))
+
+
+    def matching(self, codes) -> frozenset[str]:
+        """ The codes (normalized already) that are in the arrays."""
+        numbers, text = split_codes(set(codes))
+        return frozenset(chain(compress(numbers, in_sorted(self.numbers, as_numbers(numbers))),
+                               compress(text, in_sorted(self.text, np.array(text, dtype=str)))))
+
+
+    def save(self, path: str):
+        """ Write the arrays to path (the numbers) and path with -text before the extension (the rest).
+            Each is written to a temporary file of its own and moved into place, so a process mapping them never
+            sees half a file, and two processes saving the same arrays don't write over each other's. """
+        for array, array_path in zip((self.numbers, self.text), array_paths(path)):
+            handle, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(array_path) or ".")
+            try:
+                with os.fdopen(handle, "wb") as file:
+                    np.save(file, array)
+                os.replace(tmp_path, array_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+
+    @classmethod
+    def load(cls, path: str) -> "ArrayCodes":
+        """ Memory-map arrays written by save()."""
+        return cls(*(np.load(array_path, mmap_mode="r") for array_path in array_paths(path)))
+
+
+
+def split_codes(codes: set[str]) -> tuple[list[str], list[str]]:
+    """ The codes that are kept as numbers, and the rest."""
+    numbers = list(filter(is_number, codes))
+    return numbers, list(codes.difference(numbers))
+
+
+
+def as_numbers(codes: list[str]) -> np.ndarray:
+    return np.fromiter(map(int, codes), dtype=np.uint64, count=len(codes))
+
+
+
+def array_paths(path: str) -> tuple[str, str]:
+    """ Paths of the number and text arrays saved at path."""
+    stem, extension = os.path.splitext(path)
+    return path, f"{stem}-text{extension}"
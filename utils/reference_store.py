@@ -0,0 +1,322 @@
+"""
+Reference Store
+
+The reference data kept in a local SQLite database, so it doesn't have to be re-read from the full CodesList and
+Supplier Code List exports every time they're needed. Each export is imported once and imported again only when
+the file changes. Smaller changes come in as delta files, CSVs with a row per added or removed code:
+
+    Action,Type,Code
+    add,plu,123456
+    add,barcode,5012345678900
+    remove,supplier,100077
+
+Action is add or remove and Type is plu, barcode or supplier. Delta files in REFERENCE_DELTA_DIR are applied in
+name order, each one once (again if the file is edited). A new full export replaces everything in its tables,
+including the changes from delta files applied before it.
+"""
+import os
+import json
+import queue
+import sqlite3
+import threading
+import pandas as pd
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from utils.contants import *
+from utils.headers import *
+from utils.normalizer import *
+from utils.reference import codes_list_rows, supplier_list_codes
+from utils.reference_arrays import ArrayCodes, array_paths
+from utils.performance import timed_stage
+
+
+KINDS = ("plu", "barcode", "supplier")
+DELTA_ACTIONS = ("add", "remove")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plu (code TEXT PRIMARY KEY, line INTEGER) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS barcode (code TEXT PRIMARY KEY, line INTEGER) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS supplier (code TEXT PRIMARY KEY, line INTEGER) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sources (name TEXT PRIMARY KEY, signature TEXT, messages TEXT);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+"""
+
+
+
+class ReferenceStore:
+    """ PLU, barcode and supplier codes in a SQLite database, each table indexed on the normalized code with the
+        code's line in the export it came from (None for codes added by a delta file).
+        sources records the signature of every export and delta file in it, and version goes up with every change.
+        Changes go through one connection, one at a time. Lookups use a pool of read-only connections that are kept
+        open for as long as the store is, so they can run at the same time as each other and as a change. """
+
+    def __init__(self, path: str = REFERENCE_STORE_FILE):
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.RLock()     # Held while changing the store
+        self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = WAL")     # Readers aren't blocked while a delta is applied
+        self._connection.executescript(SCHEMA)
+        self._readers = queue.SimpleQueue()     # Read-only connections not in use right now
+        self.array_dir = f"{os.path.splitext(self.path)[0]}-arrays"     # Where arrays() saves the codes
+
+
+    def __repr__(self):
+        counts = " | ".join(f"{self.count(kind)} {kind} codes" for kind in KINDS)
+        return f"ReferenceStore {self.path}: {counts} | version {self.version()}"
+
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+            while not self._readers.empty():
+                self._readers.get().close()
+
+
+    @contextmanager
+    def _reader(self):
+        """ A read-only connection from the pool, opening another one if they're all in use."""
+        try:
+            connection = self._readers.get_nowait()
+        except queue.Empty:
+            connection = sqlite3.connect(f"file:{quote(self.path)}?mode=ro", uri=True, timeout=30, check_same_thread=False)
+        try:
+            yield connection
+        finally:
+            self._readers.put(connection)
+
+
+    def _query(self, sql: str, parameters=()) -> list[tuple]:
+        with self._reader() as connection:
+            return connection.execute(sql, parameters).fetchall()
+
+
+    def version(self) -> int:
+        with self._reader() as connection:
+            return store_version(connection)
+
+
+    def count(self, kind: str) -> int:
+        return self._query(f"SELECT COUNT(*) FROM {table(kind)}")[0][0]
+
+
+    def source(self, name: str) -> tuple[list, list[tuple[str, str]]] | None:
+        """ (signature, header messages) the source was stored with, or None if it hasn't been."""
+        rows = self._query("SELECT signature, messages FROM sources WHERE name = ?", (name,))
+        if not rows:
+            return None
+        return json.loads(rows[0][0]), [tuple(message) for message in json.loads(rows[0][1])]
+
+
+    def _changed(self, connection: sqlite3.Connection, name: str, path: str, messages: list = ()):
+        """ Record path as the source called name, and bump the version. Call inside the transaction that changed it."""
+        connection.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+                           (name, json.dumps(file_signature(path)), json.dumps(messages)))
+        connection.execute("INSERT INTO meta VALUES ('version', 1) ON CONFLICT(key) DO UPDATE SET value = value + 1")
+
+
+    def _replace(self, connection: sqlite3.Connection, kind: str, rows: dict):
+        connection.execute(f"DELETE FROM {table(kind)}")
+        connection.executemany(f"INSERT INTO {table(kind)} VALUES (?, ?)", rows.items())
+
+
+    def import_codes_list(self, path: str) -> list[tuple[str, str]]:
+        """ Replace the PLUs and barcodes with the ones in a full CodesList export. Returns its header messages."""
+        plu_rows, barcode_rows, messages = codes_list_rows(pd.read_csv(path))
+        with self._lock, self._connection as connection:
+            self._replace(connection, "plu", plu_rows)
+            self._replace(connection, "barcode", barcode_rows)
+            self._changed(connection, "codes list", path, messages)
+        return messages
+
+
+    def import_supplier_list(self, path: str):
+        """ Replace the suppliers with the ones in a full Supplier Code List export."""
+        codes = supplier_list_codes(pd.read_csv(path))
+        with self._lock, self._connection as connection:
+            self._replace(connection, "supplier", {normalizer(code): None for code in codes})
+            self._changed(connection, "supplier list", path)
+
+
+    def apply_delta(self, path: str) -> dict[str, int]:
+        """ Add and remove the codes in a delta file. Returns how many rows of each action it had."""
+        changes = read_delta(path)
+        with self._lock, self._connection as connection:
+            for action, kind, code in changes:
+                if action == "add":
+                    connection.execute(f"INSERT OR IGNORE INTO {table(kind)} VALUES (?, NULL)", (code,))
+                else:
+                    connection.execute(f"DELETE FROM {table(kind)} WHERE code = ?", (code,))
+            self._changed(connection, f"delta {os.path.basename(path)}", path)
+        return {action: sum(change[0] == action for change in changes) for action in DELTA_ACTIONS}
+
+
+    def sync(self, full_list_file: str, supplier_file: str, delta_dir: str | None = REFERENCE_DELTA_DIR) -> list[tuple[str, str]]:
+        """ Bring the store up to date: import either export if it's changed since it was imported, then apply
+            the delta files that haven't been. An export that isn't there is fine once it's been imported.
+            Returns the CodesList header messages. """
+        with self._lock:
+            if self._stale("supplier list", supplier_file):
+                self.import_supplier_list(supplier_file)
+            if self._stale("codes list", full_list_file):
+                self.import_codes_list(full_list_file)
+            for path in delta_files(delta_dir):
+                if self._stale(f"delta {os.path.basename(path)}", path):
+                    self.apply_delta(path)
+            return self.source("codes list")[1]
+
+
+    def _stale(self, name: str, path: str) -> bool:
+        stored = self.source(name)
+        if stored is not None and not os.path.exists(path):
+            return False
+        return stored is None or stored[0] != list(file_signature(path))
+
+
+    def array_reference(self) -> "ArrayReference":
+        """ The store as it is now, as a reference for the checks that looks codes up in memory-mapped arrays."""
+        return ArrayReference(self, *self.arrays())
+
+
+    def arrays(self) -> tuple[int, dict[str, ArrayCodes]]:
+        """ The version of the store and its codes by kind as memory-mapped ArrayCodes, saved in array_dir.
+            Each version's arrays are saved the first time they're asked for, and older versions' deleted.
+            Threads take turns, so a version is only built once in a process and one thread's cleanup can't
+            delete arrays another is still saving. """
+        with self._lock, self._reader() as connection:
+            connection.execute("BEGIN")     # So the codes saved are all from the version they're saved as
+            try:
+                version = store_version(connection)
+                paths = {kind: os.path.join(self.array_dir, f"{kind}-{version}.npy") for kind in KINDS}
+                if not all(os.path.exists(array_path) for path in paths.values() for array_path in array_paths(path)):
+                    os.makedirs(self.array_dir, exist_ok=True)
+                    for kind, path in paths.items():
+                        ArrayCodes.from_codes(code for code, in connection.execute(f"SELECT code FROM {table(kind)}")).save(path)
+            finally:
+                connection.rollback()
+
+            current = {os.path.basename(array_path) for path in paths.values() for array_path in array_paths(path)}
+            for name in os.listdir(self.array_dir):
+                if name.endswith(".npy") and name not in current:
+                    try:
+                        os.remove(os.path.join(self.array_dir, name))
+                    except OSError:
+                        pass    # Still mapped by another process (Windows won't delete it), it goes next time
+            return version, {kind: ArrayCodes.load(path) for kind, path in paths.items()}
+
+
+
+class ArrayReference:
+    """ The reference data for the checks from a ReferenceStore, in place of a ReferenceIndex of the whole CodesList.
+        plu, barcode and supplier are memory-mapped ArrayCodes of one version of the store, so processes using the
+        same version map the same files and share one copy of the codes. load_reference gives a new one when the
+        store changes. """
+
+    def __init__(self, store: ReferenceStore, version: int, codes: dict[str, ArrayCodes]):
+        self.store = store
+        self.version = version
+        self.plu, self.barcode, self.supplier = (codes[kind] for kind in KINDS)
+
+
+    def __repr__(self):
+        return f"ArrayReference: {self.store.array_dir} | version {self.version}"
+
+
+    def __reduce__(self):
+        # Worker processes open the store themselves, connections can't be pickled
+        return open_array_reference, (self.store.path,)
+
+
+    def row_of(self, code, kind: str = "plu"):
+        """ Line in the CodesList file where the code appears, or None if it isn't there."""
+        rows = self.store._query(f"SELECT line FROM {table(kind)} WHERE code = ?", (normalizer(code),))
+        return rows[0][0] if rows else None
+
+
+
+def store_version(connection: sqlite3.Connection) -> int:
+    rows = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchall()
+    return rows[0][0] if rows else 0
+
+
+
+def table(kind: str) -> str:
+    """ Table holding the kind of code. Checked, since it goes into the SQL as a name rather than a parameter."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown kind of reference code '{kind}', expected one of {KINDS}")
+    return kind
+
+
+
+def file_signature(path: str) -> tuple[str, int, int]:
+    """ (path, size, mtime) of a file. Changes whenever the file is replaced or edited."""
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+
+def delta_files(delta_dir: str | None) -> list[str]:
+    """ The delta CSVs in delta_dir in the order they're applied, or none if there's no such folder."""
+    if not delta_dir or not os.path.isdir(delta_dir):
+        return []
+    return [os.path.join(delta_dir, name) for name in sorted(os.listdir(delta_dir)) if name.lower().endswith(".csv")]
+
+
+
+def read_delta(path: str) -> list[tuple[str, str, str]]:
+    """ The (action, kind, normalized code) rows of a delta file. Codes are read as text, so leading zeros stay."""
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    df.columns = [normalize_header(c) for c in df.columns]
+    missing = [column for column in ("action", "type", "code") if column not in df.columns]
+    if missing:
+        raise ValueError(f"Delta file {path} is missing columns: {missing}")
+
+    changes = []
+    for line, (action, kind, code) in enumerate(zip(df["action"], df["type"], df["code"]), start=2):
+        action, kind, code = action.strip().lower(), kind.strip().lower(), normalizer(code)
+        if action not in DELTA_ACTIONS or kind not in KINDS:
+            raise ValueError(f"Line {line} of {path}: action must be one of {DELTA_ACTIONS} and type one of {KINDS}")
+        if code:
+            changes.append((action, kind, code))
+    return changes
+
+
+
+_stores = {}     # ReferenceStore per database file, shared by every session in the process
+_stores_lock = threading.Lock()
+_loaded = {}     # ArrayReference of the current version of the store, for reruns within the same process
+_loaded_lock = threading.Lock()
+
+
+
+def open_store(path: str = REFERENCE_STORE_FILE) -> ReferenceStore:
+    """ The process's ReferenceStore for the database file, opened the first time it's asked for."""
+    path = os.path.abspath(path)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ReferenceStore(path)
+        return _stores[path]
+
+
+
+def open_array_reference(path: str = REFERENCE_STORE_FILE) -> ArrayReference:
+    """ The store's reference as it is, without syncing it first. For worker processes given an ArrayReference."""
+    return open_store(path).array_reference()
+
+
+
+@timed_stage("reference")
+def load_reference(full_list_file: str, supplier_file: str, store_path: str = REFERENCE_STORE_FILE,
+                   delta_dir: str | None = REFERENCE_DELTA_DIR) -> tuple[ArrayReference, list[tuple[str, str]]]:
+    """ The reference store as an ArrayReference for the checks, after syncing it with the exports and delta files.
+        The same ArrayReference is given until the store changes, so reruns can tell the reference data is the same.
+        Returns the reference and header messages. """
+    store = open_store(store_path)
+    messages = store.sync(full_list_file, supplier_file, delta_dir)
+    key = (store.path, store.version())
+    with _loaded_lock:
+        if key not in _loaded:
+            _loaded.clear()     # Only keep the current version of the reference data
+            _loaded[key] = store.array_reference()
+        return _loaded[key], messages
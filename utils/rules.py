@@ -0,0 +1,221 @@
+"""
+Rules
+
+Registry of the checks run on uploads. Each rule declares the file types it applies to, the header map keys
+(columns) and reference sets it reads, and a rough cost. run_rules picks the rules for a file type, skips any
+whose columns weren't found in the upload, and runs the rest in dependency order, with independent rules
+running at the same time on a thread pool.
+"""
+import threading
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.contants import *
+from utils.frame_validators import *
+from utils.reference import Reference
+
+
+RULES = []      # Every registered Rule, in the order their results are displayed
+
+
+
+class Rule:
+    """ One check on an upload.
+        check works on the upload's columns (an UploadColumns) and returns a (line, code, message) error frame.
+        check_objects, if given, is the same check on the loaded objects and returns the messages.
+        columns must all be found in the upload for the rule to run, and after names rules that have to run first. """
+    __slots__ = ("title", "file_types", "check", "check_objects", "columns", "references", "cost", "after")
+
+    def __init__(self, title: str, file_types: list[str], check, check_objects=None,
+                 columns=(), references=(), cost: int = 1, after=()):
+        self.title = title
+        self.file_types = tuple(file_types)
+        self.check = check
+        self.check_objects = check_objects
+        self.columns = tuple(columns)
+        self.references = tuple(references)
+        self.cost = cost
+        self.after = tuple(after)
+
+
+    def __repr__(self):
+        return f"Rule {self.title}: {', '.join(self.file_types)}"
+
+
+
+class UploadColumns:
+    """ The upload's columns by header map key. A code column is normalized the first time a rule asks for it
+        and then shared, so rules on the same column share one scan of it. Safe to share between threads. """
+    __slots__ = ("df", "col_map", "_codes", "_lock", "_pending")
+
+    def __init__(self, df: pd.DataFrame, col_map: dict):
+        self.df = df
+        self.col_map = col_map
+        self._codes = {}
+        self._lock = threading.Lock()      # Only held to look results up and publish them, never while working one out
+        self._pending = {}                  # (id of cache, name) -> lock held while that result is worked out
+
+
+    def _cached(self, cache: dict, name, compute):
+        """ cache[name], set to compute() the first time it's asked for. Threads asking for the same result wait for
+            the one working it out, threads asking for different ones work them out at the same time. """
+        with self._lock:
+            if name in cache:
+                return cache[name]
+            pending = self._pending.setdefault((id(cache), name), threading.Lock())
+        with pending:
+            with self._lock:
+                if name in cache:       # Worked out while this thread waited
+                    return cache[name]
+            value = compute()
+            with self._lock:
+                cache[name] = value
+            return value
+
+
+    def has(self, key: str) -> bool:
+        return self.col_map.get(key) is not None
+
+
+    def codes(self, key: str) -> pd.Series:
+        """ frame_codes for the column."""
+        return self._cached(self._codes, key, lambda: frame_codes(self.df, self.col_map.get(key)))
+
+
+    def raw(self, key: str) -> pd.Series:
+        """ frame_column for the column."""
+        return frame_column(self.df, self.col_map.get(key))
+
+
+    # The frame checks on the columns by key. Rules call these, so IncrementalColumns can answer them from
+    # what it kept from the last upload instead.
+
+    def code_length(self, key: str, limit: int, message: str) -> pd.DataFrame:
+        return frame_code_length(self.codes(key), limit, message)
+
+
+    def exist(self, key: str, full_list) -> pd.DataFrame:
+        return frame_exist(self.codes(key), full_list)
+
+
+    def existing(self, key: str, full_list, message: str = "{code}") -> pd.DataFrame:
+        return frame_duplicates(self.codes(key), full_list, message)
+
+
+    def internal_duplicates(self, key: str) -> pd.DataFrame:
+        return frame_internal_duplicates(self.codes(key))
+
+
+    def internal_barcodes(self, key: str, code_key: str) -> pd.DataFrame:
+        return frame_internal_barcodes(self.raw(key), self.codes(code_key))
+
+
+    def clothing_duplicates(self, key: str, size_key: str, colour_key: str) -> pd.DataFrame:
+        return frame_clothing_duplicates(self.codes(key), self.raw(size_key), self.raw(colour_key))
+
+
+
+def register(rule: Rule) -> Rule:
+    """ Add a rule to the registry. Titles only need to be unique within a file type."""
+    for other in rules_for(*rule.file_types):
+        if other.title == rule.title:
+            raise ValueError(f"A rule called '{rule.title}' is already registered for {other.file_types}")
+    RULES.append(rule)
+    return rule
+
+
+
+def rules_for(*file_types: str) -> list[Rule]:
+    """ Registered rules that apply to any of the file types, in display order."""
+    return [rule for rule in RULES if set(file_types) & set(rule.file_types)]
+
+
+
+def schedule(rules: list[Rule]) -> list[Rule]:
+    """ The order to run rules in: each one after the rules named in its after, otherwise cheapest first.
+        Rules named in after that aren't in rules are ignored. """
+    titles = {rule.title for rule in rules}
+    pending = sorted(rules, key=lambda rule: rule.cost)    # Stable, so equal costs stay in display order
+    done = set()
+    ordered = []
+    while pending:
+        ready = next((rule for rule in pending if done.issuperset(titles.intersection(rule.after))), None)
+        if ready is None:
+            raise ValueError(f"Rules depend on each other: {[rule.title for rule in pending]}")
+        ordered.append(ready)
+        done.add(ready.title)
+        pending.remove(ready)
+    return ordered
+
+
+
+def waves(rules: list[Rule]) -> list[list[Rule]]:
+    """ Split scheduled rules into waves of rules that don't depend on each other.
+        Every rule is in a later wave than the rules it runs after, and keeps its scheduled order within its wave. """
+    titles = {rule.title for rule in rules}
+    level = {}
+    for rule in rules:      # Scheduled order, so a rule's dependencies already have their level
+        level[rule.title] = 1 + max((level[title] for title in rule.after if title in titles), default=-1)
+
+    grouped = [[] for _ in range(max(level.values(), default=-1) + 1)]
+    for rule in rules:
+        grouped[level[rule.title]].append(rule)
+    return grouped
+
+
+
+def run_rules(file_type: str, columns: UploadColumns, reference: Reference, records: list = None,
+              workers: int = CHECK_WORKERS) -> tuple[dict, list[str]]:
+    """ Run the rules for file_type on an upload.
+        Returns the results by rule title in display order, and the titles of the rules that were skipped because
+        a column they need wasn't found (or a rule they run after was skipped).
+        With records (the loaded objects), rules that have check_objects use it and give a list of messages,
+        everything else gives an error frame.
+        The rules in each wave run at the same time on up to workers threads, so a wave takes as long as its slowest rule.
+        workers=1 runs them one after another. """
+    rules = rules_for(file_type)
+    skipped = skipped_rules(schedule(rules), columns)
+    results = {}
+
+    def run(rule: Rule):
+        if records is not None and rule.check_objects is not None:
+            return rule.check_objects(records, reference)
+        return rule.check(columns, reference)
+
+    pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for wave in waves(schedule(rules)):
+            pending = {}
+            for rule in (wave if pool is None else sorted(wave, key=lambda rule: -rule.cost)):    # Slowest first, so they start straight away
+                if rule.title in skipped:
+                    continue
+                elif pool is None:
+                    results[rule.title] = run(rule)
+                else:
+                    pending[rule.title] = pool.submit(run, rule)
+            for title, future in pending.items():
+                results[title] = future.result()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return ({rule.title: results[rule.title] for rule in rules if rule.title in results},
+            [rule.title for rule in rules if rule.title in skipped])
+
+
+
+def skipped_rules(rules: list[Rule], columns: UploadColumns) -> set[str]:
+    """ Titles of the scheduled rules that can't run: a column they need wasn't found, or a rule they run after can't run."""
+    skipped = set()
+    for rule in rules:
+        if not all(columns.has(key) for key in rule.columns) or skipped.intersection(rule.after):
+            skipped.add(rule.title)
+    return skipped
+
+
+
+def messages_of(result) -> list[str]:
+    """ The messages from a rule's result, whether it's an error frame or already a list."""
+    if isinstance(result, pd.DataFrame):
+        return result["message"].tolist()
+    return list(result)
@@ -7,19 +7,35 @@ from classes.product_class import *
 from classes.clothing_class import *
 from utils.normalizer import *
 from utils.contants import *
-from collections import defaultdict, Counter
+from collections import defaultdict
+import pandas as pd
 
 
 
-def check_duplicates(items: list[Product | Clothing], full_list: list, attr: str) -> dict[int, int]:
+def lookup_set(full_list, codes=()) -> set | frozenset:
+    """ Reference codes as a normalized set for O(1) lookups.
+        Sets (e.g. the frozensets on a ReferenceIndex) are assumed to be normalized already.
+        References that look codes up in batches (the ArrayCodes of an ArrayReference) give the ones of codes they have,
+        so codes has to be every normalized code that's going to be looked up. Anything else ignores codes. """
+    if hasattr(full_list, "matching"):
+        return full_list.matching(codes)
+    if isinstance(full_list, (set, frozenset)):
+        return full_list
+    return {normalizer(x) for x in full_list}
+
+
+
+def check_duplicates(items: list[Product | Clothing], full_list, attr: str) -> dict[int, int]:
     """ Returns dictionary of what item codes are already used in the full list.
-        attr should be entered as the class variable name 
+        attr should be entered as the class variable name.
+        full_list can be a list of codes or one of the sets on a ReferenceIndex.
     """
+    values = [normalizer(getattr(item, attr, None)) for item in items]
+    full_set = lookup_set(full_list, values)
     duplicates = {}
-    for item in items:
-        value = normalizer((getattr(item, attr, None)))
-        if value in full_list:
-            duplicates[value] = items.index(item)
+    for idx, value in enumerate(values):
+        if value in full_set:
+            duplicates[value] = idx
     return duplicates
 
 
@@ -30,7 +46,7 @@ def duplicate_internal_barcodes(items: list[Product | Clothing], attr:str) -> li
     error_list = []
 
     for item in items:
-        if item.barcode:  # Skip empty or None
+        if item.barcode and pd.notna(item.barcode):  # Skip empty, None or NaN
             id = normalizer(getattr(item, attr, None))
             barcode = str(item.barcode).strip()
             barcode_to_code[item.barcode].append((id, item.excel_line))
@@ -53,14 +69,12 @@ def duplicate_internal_barcodes(items: list[Product | Clothing], attr:str) -> li
 def check_internal_duplicates(items: list[Product | Clothing], attr:str) -> dict[int, int]:
     """ Checks if there are any duplicate codes within the new file
         attr should be entered as the class variable name """
-    errors = []
-    values = [normalizer(getattr(item, attr, None)) for item in items]
-    counts = Counter(values)
-    for code, count in counts.items():
-        if count > 1:
-            lines = [item.excel_line for item in items if normalizer(getattr(item, attr, None)) == code]
-            errors.append(f"Code: {code} appears {count} times on lines {lines}")
-    return errors
+    code_lines = defaultdict(list)      # Lines grouped by code in one pass, so repeats never need a rescan
+    for item in items:
+        code_lines[normalizer(getattr(item, attr, None))].append(item.excel_line)
+
+    return [f"Code: {code} appears {len(lines)} times on lines {lines}"
+            for code, lines in code_lines.items() if len(lines) > 1]
 
 
 def check_clothing_duplicates(items: list[Clothing]):
@@ -80,16 +94,35 @@ def check_clothing_duplicates(items: list[Clothing]):
 
 
 
-def check_exist(items: list[Product | Clothing], full_list: list, attr: str) -> tuple[dict, dict]:
+def check_plu_length(items: list[Product]) -> list[str]:
+    """ Product.plu_len for the whole plu_code column at once. PLU codes must be 15 characters or less."""
+    codes = [str(item.plu_code) for item in items]
+    lengths = list(map(len, codes))
+    return [f"Line {items[i].excel_line} \u00A0\u00A0|\u00A0\u00A0 Product: {codes[i]} has PLU Code length of {lengths[i]}. Must be under 15."
+            for i, length in enumerate(lengths) if length > 15]
+
+
+
+def check_style_length(items: list[Clothing]) -> list[str]:
+    """ Clothing.style_len for the whole style_code column at once. Style codes must be 12 characters or less."""
+    codes = [str(item.style_code) for item in items]
+    lengths = list(map(len, codes))
+    return [f"Line {items[i].excel_line} \u00A0\u00A0|\u00A0\u00A0 Clothing item: {codes[i]} has Style Code length of {lengths[i]}. Must be under 10."
+            for i, length in enumerate(lengths) if length > 12]
+
+
+
+def check_exist(items: list[Product | Clothing], full_list, attr: str) -> tuple[dict, dict]:
     """ Returns dictionary of what item codes are already used in the full list. """
     nonexist = []
 
+    codes = [normalizer(str(getattr(item, attr, ""))) for item in items]  # Make sure it's a str before normalizing
+
     # Normalize full list once
-    full_list_cleaned = [normalizer(str(x)) for x in full_list]
+    full_set = lookup_set(full_list, codes)
 
-    for idx, item in enumerate(items):
-        code = normalizer(str(getattr(item, attr, "")))  # Make sure it's a str before normalizing
-        if code not in full_list_cleaned:
+    for idx, code in enumerate(codes):
+        if code not in full_set:
             nonexist.append(f"Line {idx+2} \u00A0\u00A0|\u00A0\u00A0 '{code}' does not currently exist in data base.")
 
     return nonexist
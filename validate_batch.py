@@ -0,0 +1,133 @@
+"""
+Validate Batch
+
+Validate a folder of supplier files without the Streamlit interface, e.g. the nightly drop folder:
+
+    python validate_batch.py drop_folder/ --type Product --out validation_summaries/
+
+Files are validated in parallel, one per worker process, and a JSON or CSV summary is written for each one.
+"""
+import os
+import csv
+import json
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pipeline import *
+from utils.reference_store import ArrayReference
+
+
+_reference = None   # ArrayReference for this worker process, set once by init_worker
+
+
+def init_worker(reference: ArrayReference, log_level: int | None = None):
+    """ Keep the reference the parent loaded. It's sent to the worker as the store's path, and the worker maps the
+        arrays the parent saved for that version, so workers neither read the reference files nor copy the codes.
+        With log_level, each worker logs the time of every step it runs. """
+    global _reference
+    _reference = reference
+    if log_level is not None:
+        log_stages(log_level)
+
+
+
+def validate_worker(path: str, file_type: str, stream: bool = False) -> dict:
+    """ validate_file in a worker process. A file that can't be read is recorded in its summary instead of stopping the batch."""
+    try:
+        return validate_file(path, file_type, _reference, check_workers=1, stream=stream)     # Already one process per core
+    except Exception as e:
+        return {"file": os.path.basename(path), "file_type": file_type, "passed": False, "error": f"{type(e).__name__}: {e}"}
+
+
+
+def find_files(paths: list[str]) -> list[str]:
+    """ The given files, plus every .xlsx and .csv file in the given folders."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path) if name.lower().endswith((".xlsx", ".csv")) and not name.startswith("~$"))
+            files.extend(os.path.join(path, name) for name in names)
+        else:
+            files.append(path)
+    return files
+
+
+
+def summary_rows(summary: dict) -> list[list[str]]:
+    """ Flatten a summary into (section, title, detail) rows for the CSV format."""
+    if "error" in summary:
+        return [["failed", "Error reading file", summary["error"]]]
+
+    rows = [["missing_column", col, ""] for col in summary["missing_columns"]]
+    rows += [["unrecognized_column", col, ""] for col in summary["unrecognized_columns"]]
+    rows += [[message["type"], "Header", message["message"]] for message in summary["messages"]]
+    for title, errors in summary["errors"].items():
+        rows += [["error", title, str(error)] for error in errors]
+    for category, changes in summary["auto_changes"].items():
+        rows += [["auto_change", category, change] for change in changes]
+    return rows
+
+
+
+def write_summary(summary: dict, out_dir: str, format: str = "json") -> str:
+    """ Write one file's summary to out_dir as <file name>.json or <file name>.csv and return its path.
+        The file name keeps its extension (dup.xlsx.json), so dup.xlsx and dup.csv don't overwrite each other's summary. """
+    path = os.path.join(out_dir, f"{summary['file']}.{format}")
+    if format == "csv":
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(["section", "title", "detail"])
+            writer.writerows(summary_rows(summary))
+    else:
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(summary, file, indent=2, ensure_ascii=False, default=str)
+    return path
+
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Validate supplier upload files in parallel.")
+    parser.add_argument("paths", nargs="+", help="Files, or folders of .xlsx and .csv files, to validate")
+    parser.add_argument("--type", dest="file_type", choices=list(PIPELINES), default="Product", help="Type of every file in the batch")
+    parser.add_argument("--out", default=SUMMARY_DIR, help="Folder the summaries are written to")
+    parser.add_argument("--format", choices=["json", "csv"], default="json", help="Summary format")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--codes-list", default=FULL_LIST_FILE, help="Reference CodesList file")
+    parser.add_argument("--supplier-list", default=SUPPLIER_LIST_FILE, help="Reference Supplier Code List file")
+    parser.add_argument("--reference-deltas", default=REFERENCE_DELTA_DIR, help="Folder of reference delta files to apply")
+    parser.add_argument("--stream", action="store_true", help="Read each file a chunk at a time, for files too large to read in whole")
+    parser.add_argument("--log-stages", action="store_true", help="Log the time and rows of every step to stderr")
+    args = parser.parse_args(argv)
+    log_level = logging.INFO if args.log_stages else None
+    if log_level is not None:
+        log_stages(log_level)
+
+    files = find_files(args.paths)
+    if not files:
+        parser.error("no files to validate")
+
+    # Sync the reference store once here, before the workers start and open it
+    reference, messages = load_reference(args.codes_list, args.supplier_list, delta_dir=args.reference_deltas)
+    for message, type in messages:
+        print(f"{type}: {message}")
+    os.makedirs(args.out, exist_ok=True)
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(reference, log_level)) as pool:
+        futures = [pool.submit(validate_worker, path, args.file_type, args.stream) for path in files]
+        for future in as_completed(futures):
+            summary = future.result()
+            path = write_summary(summary, args.out, args.format)
+            if not summary["passed"]:
+                failed += 1
+            status = "ERROR" if "error" in summary else "PASS" if summary["passed"] else "FAIL"
+            print(f"{status:<5} {summary['file']} -> {path}")
+
+    print(f"{len(files) - failed}/{len(files)} files passed")
+    return 1 if failed else 0
+
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,5 +1,5 @@
 import pandas as pd
-from collections import Counter, defaultdict
+from collections import defaultdict
 from classes.product_class import Product
 from classes.clothing_class import Clothing
 from utils.headers import *
@@ -30,13 +30,12 @@ def get_all_plu(path: str) -> list[int]:
 
 def find_internal_duplicates(products: list[Product]) -> list[str]:
     """Checks for duplicate PLU codes within the new product file."""
-    counts = Counter(product.plu_code for product in products)
-    errors = []
-    for plu, count in counts.items():
-        if count > 1:
-            lines = [product.excel_line for product in products if product.plu_code == plu]
-            errors.append(f"PLU Code: {plu} appears {count} times on lines {lines}")
-    return errors
+    plu_lines = defaultdict(list)
+    for product in products:
+        plu_lines[product.plu_code].append(product.excel_line)
+
+    return [f"PLU Code: {plu} appears {len(lines)} times on lines {lines}"
+            for plu, lines in plu_lines.items() if len(lines) > 1]
 
 
 